@@ -1,3 +1,7 @@
+import threading
 from apps.gradio.app import app
+from src.scripts.model_load import warmup
 
+# Load models while the server starts, first requests wait for warmup to finish
+threading.Thread(target=warmup, daemon=True).start()
 app.launch(server_name="0.0.0.0", server_port=7860)
@@ -1,7 +1,8 @@
 import gradio as gr
-from src.scripts.model_load import predict as model
+from src.scripts.inference_service import get_service
 
 def predict(text):
-    return model([text])[0]
+    return get_service().predict_sync(text)
 
-app = gr.Interface(fn=predict, inputs="text", outputs="text")
+# Concurrent requests are coalesced into batches by the inference service
+app = gr.Interface(fn=predict, inputs="text", outputs="text", concurrency_limit=None)
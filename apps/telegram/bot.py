@@ -1,9 +1,12 @@
 import os
+import threading
 import telebot
-from src.scripts.model_load import predict
+from src.scripts.inference_service import get_service
+from src.scripts.model_load import warmup
 
 TOKEN = os.getenv('TELEGRAM_TOKEN')
-bot = telebot.TeleBot(TOKEN)
+# Handlers block on the inference service, enough threads let bursts form batches
+bot = telebot.TeleBot(TOKEN, num_threads=int(os.getenv('TELEGRAM_THREADS', '16')))
 
 @bot.message_handler(commands=['start'])
 def start(message):
@@ -11,7 +14,8 @@ def start(message):
 
 @bot.message_handler(func=lambda message: True)
 def echo_all(message):
-    response = predict([message.text])
+    response = get_service().predict_sync(message.text)
     bot.reply_to(message, response)
 
+threading.Thread(target=warmup, daemon=True).start()
 bot.infinity_polling()
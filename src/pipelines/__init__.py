@@ -1,3 +1,9 @@
-from .pipelines import preprocessing_pieline, text_vecrotization_pipeline, classification_pipeline
+from .pipelines import (
+    preprocessing_pieline, text_vecrotization_pipeline, classification_pipeline,
+    get_sbert_vectorizer, vectorization_settings
+)
+from .booster_predictor import BoosterPredictor
+from .profiled_pipeline import ProfiledPipeline
 
-__all__ = ['preprocessing_pieline', 'text_vecrotization_pipeline', 'classification_pipeline']
+__all__ = ['preprocessing_pieline', 'text_vecrotization_pipeline', 'classification_pipeline',
+           'get_sbert_vectorizer', 'vectorization_settings', 'BoosterPredictor', 'ProfiledPipeline']
@@ -0,0 +1,42 @@
+import json
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.pipeline import Pipeline
+from src.util.pickle_compatible import PickleCompatible
+
+class BoosterPredictor(BaseEstimator, ClassifierMixin, PickleCompatible):
+    """
+    Serving wrapper for a binary XGBoost booster. Calls Booster.inplace_predict
+    on a contiguous float32 array, skipping sklearn input validation and DMatrix creation.
+    """
+    def __init__(self, booster, threshold=0.5, n_threads=1):
+        # A copy, so the thread setting doesn't leak into the pipeline the booster came from
+        self.booster = booster.copy()
+        # Probability of the positive class above which 1 is predicted
+        self.threshold = threshold
+        # Single requests are too small to benefit from many threads
+        self.n_threads = n_threads
+        objective = json.loads(booster.save_config())['learner']['objective']['name']
+        if objective != 'binary:logistic':
+            raise ValueError(f'Only binary:logistic boosters are supported, got {objective}')
+        self.booster.set_param({'nthread': n_threads})
+        best_iteration = booster.attr('best_iteration')
+        self.iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+
+    @classmethod
+    def from_pipeline(cls, pipeline, **kwargs):
+        classifier = pipeline[-1] if isinstance(pipeline, Pipeline) else pipeline
+        return cls(classifier.get_booster(), **kwargs)
+
+    def fit(self, X, y=None):
+        return self
+
+    def predict_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        positive = self.booster.inplace_predict(X, iteration_range=self.iteration_range)
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X):
+        return (self.predict_proba(X)[:, 1] > self.threshold).astype(np.int64)
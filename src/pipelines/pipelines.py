@@ -1,15 +1,22 @@
+import numpy as np
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer, make_column_selector as selector
 from sklearn.preprocessing import FunctionTransformer, StandardScaler
 from xgboost import XGBClassifier
+from src.pipelines.profiled_pipeline import ProfiledPipeline
 from src.transformers import (
-    fix_concatenated_words, SpacyTokenizer, ExtraFeatures,
-    FeatureSelector, SbertVectorizer, fix_feature_names
+    fix_concatenated_words, iter_fix_concatenated_words, SpacyTokenizer, ExtraFeatures,
+    FeatureSelector, SbertVectorizer, EmbeddingReducer, fix_feature_names
 )
 
-def preprocessing_pieline(top_k_feat=15):
+def preprocessing_pieline(top_k_feat=15, n_process=1, batch_size=5000, streaming=False, n_jobs=1,
+                          docs_cache_dir=None, selection_cache_dir=None, selection_sample_size=None):
     extra_features_routine = Pipeline([
-        ('selector', FeatureSelector(top_k_feat)),
+        ('selector', FeatureSelector(
+            top_k_feat,
+            cache_dir=selection_cache_dir,
+            sample_size=selection_sample_size
+        )),
         ('scaler', StandardScaler().set_output(transform="pandas")),
     ])
     col_transformer = ColumnTransformer([
@@ -17,23 +24,62 @@ def preprocessing_pieline(top_k_feat=15):
     ], remainder='passthrough')
     extra_features_routine.set_output(transform='pandas')
     col_transformer.set_output(transform='pandas')
-    return Pipeline([
-        ('splitter', FunctionTransformer(fix_concatenated_words, validate=False)),
-        ('tokenizer', SpacyTokenizer()),
-        ('features_extractor', ExtraFeatures()),
+    # Streaming mode passes lazy iterables between the text stages instead of lists,
+    # so only about batch_size spaCy Docs are alive at any moment
+    splitter = iter_fix_concatenated_words if streaming else fix_concatenated_words
+    return ProfiledPipeline([
+        ('splitter', FunctionTransformer(splitter, validate=False)),
+        ('tokenizer', SpacyTokenizer(
+            n_process=n_process,
+            batch_size=batch_size,
+            materialize=not streaming,
+            cache_dir=docs_cache_dir
+        )),
+        ('features_extractor', ExtraFeatures(n_jobs=n_jobs, url_mode='fast')),
         ('column_transformer', col_transformer)
-    ])
+    ], profile_name='preprocessing')
 
-def text_vecrotization_pipeline():
+def text_vecrotization_pipeline(embedding_cache_dir=None, model_name='sentence-transformers/all-mpnet-base-v2',
+                                reduction=None, reduction_dim=128):
+    sbert = SbertVectorizer(model_name=model_name, cache_dir=embedding_cache_dir)
+    if reduction is not None:
+        # Only embeddings are reduced, extra features pass through as they are
+        sbert = Pipeline([
+            ('sbert', sbert),
+            ('reduce', EmbeddingReducer(reduction, n_components=reduction_dim))
+        ])
     vectorizer = ColumnTransformer([
-        ('sbert_vectorize', SbertVectorizer(), 'text')
+        ('sbert_vectorize', sbert, 'text')
     ], remainder='passthrough')
-    return Pipeline([
+    return ProfiledPipeline([
         ('fix_column_names', FunctionTransformer(fix_feature_names, validate=False)),
-        ('vectorize', vectorizer)
-    ])
+        ('vectorize', vectorizer),
+        # XGBoost works with float32 anyway, no need to keep float64 copies
+        ('to_float32', FunctionTransformer(np.asarray, kw_args={'dtype': np.float32}))
+    ], profile_name='vectorization')
 
 def classification_pipeline(params):
-    return Pipeline([
+    return ProfiledPipeline([
         ("clf", XGBClassifier(**params))
-    ])
+    ], profile_name='classification')
+
+def _sbert_branch(pipeline):
+    column_transformer = pipeline.named_steps['vectorize']
+    # Fitted ColumnTransformer works with clones kept in transformers_
+    transformers = getattr(column_transformer, 'transformers_', column_transformer.transformers)
+    return next(transformer for name, transformer, _ in transformers if name == 'sbert_vectorize')
+
+def get_sbert_vectorizer(pipeline):
+    sbert = _sbert_branch(pipeline)
+    return sbert[0] if isinstance(sbert, Pipeline) else sbert
+
+def vectorization_settings(pipeline):
+    # Everything that changes the vectorization output, embeddings reduction included
+    settings = get_sbert_vectorizer(pipeline).vectorization_settings()
+    sbert = _sbert_branch(pipeline)
+    if isinstance(sbert, Pipeline):
+        reducer = sbert.named_steps['reduce']
+        settings['reduction'] = {
+            'method': reducer.method, 'n_components': reducer.n_components, 'random_state': reducer.random_state
+        }
+    return settings
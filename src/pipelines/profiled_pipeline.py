@@ -0,0 +1,49 @@
+from collections.abc import Iterator
+from sklearn.pipeline import Pipeline, _final_estimator_has
+from sklearn.utils.metaestimators import available_if
+from src.util import profiler, SizedStream
+
+def _rows(X):
+    return len(X) if hasattr(X, '__len__') else None
+
+class ProfiledPipeline(Pipeline):
+    """
+    Pipeline that records every step of transform and predict as a profiler stage
+    named '<profile_name>.<step name>'. While profiling, lazy step outputs are materialized,
+    otherwise their work would be attributed to the next step.
+    """
+    def __init__(self, steps, *, memory=None, verbose=False, profile_name='pipeline'):
+        super().__init__(steps, memory=memory, verbose=verbose)
+        self.profile_name = profile_name
+
+    @classmethod
+    def from_pipeline(cls, pipeline, profile_name):
+        if isinstance(pipeline, cls):
+            return pipeline
+        return cls(
+            pipeline.steps, memory=pipeline.memory, verbose=pipeline.verbose, profile_name=profile_name
+        )
+
+    def _transform_steps(self, X, with_final):
+        for _, name, transform in self._iter(with_final=with_final):
+            with profiler.stage(f'{self.profile_name}.{name}', _rows(X)):
+                X = transform.transform(X)
+                if profiler.enabled and isinstance(X, (Iterator, SizedStream)):
+                    X = list(X)
+        return X
+
+    @available_if(Pipeline._can_transform)
+    def transform(self, X):
+        return self._transform_steps(X, with_final=True)
+
+    @available_if(_final_estimator_has('predict'))
+    def predict(self, X, **predict_params):
+        Xt = self._transform_steps(X, with_final=False)
+        with profiler.stage(f'{self.profile_name}.{self.steps[-1][0]}', _rows(Xt)):
+            return self.steps[-1][1].predict(Xt, **predict_params)
+
+    @available_if(_final_estimator_has('predict_proba'))
+    def predict_proba(self, X, **predict_proba_params):
+        Xt = self._transform_steps(X, with_final=False)
+        with profiler.stage(f'{self.profile_name}.{self.steps[-1][0]}', _rows(Xt)):
+            return self.steps[-1][1].predict_proba(Xt, **predict_proba_params)
@@ -0,0 +1,142 @@
+import logging
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score
+from src.transformers import fix_concatenated_words, SpacyTokenizer, SbertVectorizer, EmbeddingReducer
+from src.pipelines import classification_pipeline
+from src.util import PathHelper, set_log_file, load_features
+
+parser = argparse.ArgumentParser(description='A script that measures preprocessing throughput.')
+parser.add_argument(
+    '--stage',
+    choices=['tokenizer', 'vectorizer', 'reduction'],
+    default='tokenizer',
+    help='Pipeline part to measure.'
+)
+parser.add_argument(
+    '--sample_n',
+    type=int,
+    default=5000,
+    help='Amount of messages from the data set to process.'
+)
+parser.add_argument(
+    '--n_process',
+    type=int,
+    nargs='+',
+    default=[1, 2, 4, 8],
+    help='spaCy process counts to compare.'
+)
+parser.add_argument(
+    '--batch_size',
+    type=int,
+    default=1000,
+    help='spaCy batch size.'
+)
+parser.add_argument(
+    '--backends',
+    nargs='+',
+    default=['torch', 'onnx', 'onnx-int8'],
+    help='SBERT backends to compare, onnx-int8 is the quantized ONNX model.'
+)
+parser.add_argument(
+    '--reduction',
+    choices=EmbeddingReducer.methods,
+    default='pca',
+    help='Embeddings reduction method to measure.'
+)
+parser.add_argument(
+    '--dims',
+    type=int,
+    nargs='+',
+    default=[0, 32, 64, 128, 256],
+    help='Embedding dimensions to compare, 0 keeps the full embeddings.'
+)
+parser.add_argument(
+    '--embedding_dim',
+    type=int,
+    default=768,
+    help='Leading columns of the vectorized data that are SBERT embeddings.'
+)
+
+def benchmark_tokenizer(texts, n_process, batch_size):
+    tokenizer = SpacyTokenizer(n_process=n_process, batch_size=batch_size, materialize=False)
+    start = time.perf_counter()
+    count = sum(1 for _ in tokenizer.transform(texts))
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+def benchmark_vectorizer(texts, backend, latency_n=50):
+    vectorizer = SbertVectorizer(backend=backend.split('-')[0], quantize=backend.endswith('-int8'))
+    start = time.perf_counter()
+    vectorizer.transform(texts)
+    docs_per_sec = len(texts) / (time.perf_counter() - start)
+    latencies = []
+    for text in texts[:latency_n]:
+        start = time.perf_counter()
+        vectorizer.transform([text])
+        latencies.append(time.perf_counter() - start)
+    return docs_per_sec, np.median(latencies) * 1000
+
+def benchmark_reduction(X_train, y_train, X_test, y_test, method, dim, embedding_dim):
+    """Accuracy, training and inference time of the classifier on embeddings reduced to dim."""
+    start = time.perf_counter()
+    if dim:
+        reducer = EmbeddingReducer(method, n_components=dim).fit(X_train[:, :embedding_dim])
+        reduce = lambda X: np.hstack([reducer.transform(X[:, :embedding_dim]), X[:, embedding_dim:]])
+    else:
+        reduce = lambda X: X
+    X_train = np.asarray(reduce(X_train), dtype=np.float32)
+    classifier = classification_pipeline({'n_estimators': 300, 'max_depth': 6, 'tree_method': 'hist', 'n_jobs': 2})
+    classifier.fit(X_train, y_train)
+    train_time = time.perf_counter() - start
+    start = time.perf_counter()
+    y_pred = classifier.predict(np.asarray(reduce(X_test), dtype=np.float32))
+    inference_time = time.perf_counter() - start
+    return accuracy_score(y_test, y_pred), train_time, inference_time
+
+def reduction_report(args, logger):
+    # Vectorized data of the last training run
+    X_train = np.load(PathHelper.data.processed.x_train_vectorized, mmap_mode='r')
+    X_test = np.load(PathHelper.data.processed.x_test_vectorized, mmap_mode='r')
+    y_train = load_features(PathHelper.data.processed.y_train)['class'].to_numpy()
+    y_test = load_features(PathHelper.data.processed.y_test)['class'].to_numpy()
+    for dim in args.dims:
+        accuracy, train_time, inference_time = benchmark_reduction(
+            X_train, y_train, X_test, y_test, args.reduction, dim, args.embedding_dim
+        )
+        logger.info(
+            '%s dim=%i: accuracy %.4f, training %.1f sec, inference %.1f ms per 1000 messages',
+            args.reduction, dim or args.embedding_dim, accuracy, train_time,
+            inference_time / len(X_test) * 1e6
+        )
+
+if __name__ == '__main__':
+    set_log_file(PathHelper.logs.benchmark)
+    logger = logging.getLogger(__name__)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.stage == 'reduction':
+        reduction_report(args, logger)
+    elif args.stage == 'vectorizer':
+        df = pd.read_csv(PathHelper.data.raw.data_set)
+        texts = fix_concatenated_words(df['text'].sample(n=args.sample_n, random_state=42))
+        for backend in args.backends:
+            docs_per_sec, latency_ms = benchmark_vectorizer(texts, backend)
+            baseline = baseline or docs_per_sec
+            logger.info(
+                'SBERT backend=%s: %.1f docs/sec (x%.2f), %.1f ms per message',
+                backend, docs_per_sec, docs_per_sec / baseline, latency_ms
+            )
+    else:
+        df = pd.read_csv(PathHelper.data.raw.data_set)
+        texts = fix_concatenated_words(df['text'].sample(n=args.sample_n, random_state=42))
+        for n_process in args.n_process:
+            docs_per_sec = benchmark_tokenizer(texts, n_process, args.batch_size)
+            baseline = baseline or docs_per_sec
+            logger.info(
+                'spaCy n_process=%i batch_size=%i: %.1f docs/sec (x%.2f)',
+                n_process, args.batch_size, docs_per_sec, docs_per_sec / baseline
+            )
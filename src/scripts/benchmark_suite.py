@@ -0,0 +1,264 @@
+import json
+import logging
+import re
+import sys
+import time
+import argparse
+import platform
+from collections import Counter
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.transformers import fix_concatenated_words, SpacyTokenizer, ExtraFeatures, SbertVectorizer
+from src.util import PathHelper, set_log_file
+
+parser = argparse.ArgumentParser(description='A script that benchmarks preprocessing, vectorization and inference.')
+parser.add_argument(
+    '--stages',
+    nargs='+',
+    default=['splitter', 'tokenizer', 'features', 'vectorizer', 'predict'],
+    help='Stages to measure.'
+)
+parser.add_argument(
+    '--corpus',
+    choices=['synthetic', 'data_set'],
+    default='synthetic',
+    help='Generated messages of varying length or a sample of the data set.'
+)
+parser.add_argument(
+    '--sample_n',
+    type=int,
+    default=1000,
+    help='Amount of messages to process.'
+)
+parser.add_argument(
+    '--latency_n',
+    type=int,
+    default=200,
+    help='Amount of single message calls for latency percentiles.'
+)
+parser.add_argument(
+    '--model',
+    choices=['tiny', 'trained'],
+    default='tiny',
+    help='tiny builds a small local SBERT and fits the pipelines on the corpus, trained uses models/.'
+)
+parser.add_argument(
+    '--output',
+    default=PathHelper.logs.benchmark_results,
+    help='Where to save results as JSON.'
+)
+parser.add_argument(
+    '--baseline',
+    default=PathHelper.logs.benchmark_baseline,
+    help='Results of a previous run to compare with.'
+)
+parser.add_argument(
+    '--save_baseline',
+    action='store_true',
+    help='Overwrite the baseline with the results of this run.'
+)
+parser.add_argument(
+    '--tolerance',
+    type=float,
+    default=0.2,
+    help='Allowed relative throughput drop or p99 latency growth before it is flagged as a regression.'
+)
+
+logger = logging.getLogger(__name__)
+
+_topic_words = {
+    'suicide': [
+        'tired', 'alone', 'empty', 'pain', 'hopeless', 'goodbye', 'worthless', 'crying',
+        'nobody', 'end', 'hurt', 'dark', 'sleep', 'forever', 'anymore', 'burden'
+    ],
+    'non-suicide': [
+        'game', 'pizza', 'school', 'friends', 'movie', 'weekend', 'music', 'funny',
+        'homework', 'party', 'dog', 'phone', 'crush', 'meme', 'teacher', 'summer'
+    ]
+}
+_common_words = [
+    'i', 'you', 'the', 'a', 'and', 'to', 'it', 'is', 'my', 'me', 'that', 'of', 'in', 'just',
+    'so', 'like', 'feel', 'know', 'want', 'really', 'dont', 'what', 'have', 'but', 'with',
+    'today', 'people', 'time', 'think', 'never', 'always', 'life', 'day', 'night', 'why'
+]
+_noise = [':)', ':(', 'xD', 'https://example.com/page', 'www.test.org', '!!!', '???', '...', 'f**k']
+
+def synthetic_corpus(n, seed=42):
+    """
+    Messages with log-normally distributed lengths (a few words up to several thousand),
+    typos, glued sentences, emoticons, URLs and new lines. Same seed gives the same corpus.
+    """
+    rng = np.random.default_rng(seed)
+    classes = list(_topic_words)
+    texts, labels = [], []
+    for _ in range(n):
+        label = classes[rng.integers(len(classes))]
+        n_words = int(np.clip(rng.lognormal(3.5, 1.2), 3, 5000))
+        vocab = _common_words * 3 + _topic_words[label]
+        words = [vocab[i] for i in rng.integers(len(vocab), size=n_words)]
+        for i in np.flatnonzero(rng.random(n_words) < 0.08):
+            words[i] = words[i] + rng.choice(['.', '!', '?', ',']) + (' ' if rng.random() < 0.7 else '')
+        for i in np.flatnonzero(rng.random(n_words) < 0.02):
+            words[i] = _noise[rng.integers(len(_noise))]
+        for i in np.flatnonzero(rng.random(n_words) < 0.03):
+            # Swap two letters to make a typo
+            word = words[i]
+            if len(word) > 3:
+                j = rng.integers(len(word) - 1)
+                words[i] = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+        text = ' '.join(words).replace('. ', '.\n', int(rng.integers(3)))
+        texts.append(text[0].upper() + text[1:])
+        labels.append(label)
+    return texts, labels
+
+def load_corpus(kind, n):
+    if kind == 'synthetic':
+        return synthetic_corpus(n)
+    df = pd.read_csv(PathHelper.data.raw.data_set).sample(n=n, random_state=42)
+    return df['text'].tolist(), df['class'].tolist()
+
+def build_tiny_sbert(path, texts, dim=32, max_seq_length=128):
+    """Randomly initialised 2 layer BERT with a vocabulary from the corpus, saved as a SentenceTransformer."""
+    # pylint: disable=import-outside-toplevel
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast, set_seed
+    path = Path(path)
+    if (path / 'modules.json').exists():
+        return path
+    words = Counter(w for text in texts for w in re.findall(r"\w+|[^\w\s]", text.lower()))
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + [w for w, _ in words.most_common(5000)]
+    transformer_dir = path / 'transformer'
+    transformer_dir.mkdir(parents=True, exist_ok=True)
+    (transformer_dir / 'vocab.txt').write_text('\n'.join(vocab), encoding='utf-8')
+    tokenizer = BertTokenizerFast(str(transformer_dir / 'vocab.txt'), do_lower_case=True)
+    config = BertConfig(
+        vocab_size=len(vocab), hidden_size=dim, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=dim * 2, max_position_embeddings=max_seq_length + 2
+    )
+    set_seed(42)
+    BertModel(config).save_pretrained(transformer_dir)
+    tokenizer.save_pretrained(transformer_dir)
+    transformer = models.Transformer(str(transformer_dir), max_seq_length=max_seq_length)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension())
+    SentenceTransformer(modules=[transformer, pooling]).save(str(path))
+    return path
+
+def measure(fn, X, latency_n):
+    """Throughput of one call over the whole X and latency percentiles of single item calls."""
+    start = time.perf_counter()
+    fn(X)
+    elapsed = time.perf_counter() - start
+    latencies = []
+    for x in X[:latency_n]:
+        start = time.perf_counter()
+        fn([x])
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1000
+    return {
+        'docs_per_sec': len(X) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'n': len(X)
+    }
+
+def tiny_predictor(texts, labels, model_name):
+    """Predictor with components fitted on the benchmark corpus instead of the trained artifacts."""
+    # pylint: disable=import-outside-toplevel
+    from sklearn.preprocessing import LabelEncoder
+    from src.pipelines import (
+        preprocessing_pieline, text_vecrotization_pipeline, classification_pipeline, BoosterPredictor
+    )
+    from src.scripts.model_load import Predictor
+    label_encoder = LabelEncoder()
+    y = label_encoder.fit_transform(labels)
+    preprocessing = preprocessing_pieline(top_k_feat=5)
+    vectorization = text_vecrotization_pipeline(model_name=model_name)
+    classification = classification_pipeline({'n_estimators': 50, 'max_depth': 4, 'n_jobs': 1})
+    X = vectorization.fit_transform(preprocessing.fit_transform(texts, y))
+    classification.fit(X, y)
+    components = {
+        'label_encoder': label_encoder,
+        'preprocessor': preprocessing,
+        'vectorizer': vectorization,
+        'classifier': BoosterPredictor.from_pipeline(classification)
+    }
+    predictor = Predictor()
+    predictor.loaders = {name: (lambda c=component: c) for name, component in components.items()}
+    return predictor
+
+def run_suite(stages, texts, labels, model, latency_n):
+    results = {}
+    fixed = fix_concatenated_words(texts)
+    if 'splitter' in stages:
+        results['splitter'] = measure(fix_concatenated_words, texts, latency_n)
+    if 'tokenizer' in stages or 'features' in stages:
+        tokenizer = SpacyTokenizer()
+        if 'tokenizer' in stages:
+            results['tokenizer'] = measure(tokenizer.transform, fixed, latency_n)
+        if 'features' in stages:
+            docs = tokenizer.transform(fixed)
+            results['features'] = measure(ExtraFeatures(url_mode='fast').transform, docs, latency_n)
+    model_name = 'sentence-transformers/all-mpnet-base-v2'
+    if model == 'tiny' and ('vectorizer' in stages or 'predict' in stages):
+        model_name = str(build_tiny_sbert(PathHelper.cache.benchmark_model, texts))
+    if 'vectorizer' in stages:
+        results['vectorizer'] = measure(SbertVectorizer(model_name=model_name).transform, fixed, latency_n)
+    if 'predict' in stages:
+        if model == 'tiny':
+            predictor = tiny_predictor(texts, labels, model_name)
+        else:
+            from src.scripts.model_load import predictor  # pylint: disable=import-outside-toplevel
+        predictor.warmup()
+        results['predict'] = measure(predictor.predict, texts, latency_n)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Stages where throughput dropped or p99 latency grew more than tolerance compared to baseline."""
+    regressions = {}
+    for stage, current in results.items():
+        previous = baseline.get(stage)
+        if previous is None:
+            continue
+        throughput = current['docs_per_sec'] / previous['docs_per_sec']
+        latency = current['p99_ms'] / previous['p99_ms'] if previous['p99_ms'] else 1.0
+        if throughput < 1 - tolerance or latency > 1 + tolerance:
+            regressions[stage] = {'throughput_ratio': throughput, 'p99_ratio': latency}
+    return regressions
+
+if __name__ == '__main__':
+    set_log_file(PathHelper.logs.benchmark)
+    args = parser.parse_args()
+
+    texts, labels = load_corpus(args.corpus, args.sample_n)
+    results = run_suite(args.stages, texts, labels, args.model, args.latency_n)
+    report = {
+        'settings': {
+            'corpus': args.corpus, 'sample_n': args.sample_n, 'latency_n': args.latency_n,
+            'model': args.model, 'python': platform.python_version(), 'machine': platform.machine()
+        },
+        'results': results
+    }
+    for stage, stats in results.items():
+        logger.info(
+            '%s: %.1f docs/sec, p50 %.2f ms, p99 %.2f ms',
+            stage, stats['docs_per_sec'], stats['p50_ms'], stats['p99_ms']
+        )
+    Path(args.output).write_text(json.dumps(report, indent=2))
+
+    regressions = {}
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        if baseline['settings'] != report['settings']:
+            logger.warning('Baseline was measured with other settings: %s', baseline['settings'])
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for stage, ratios in regressions.items():
+            logger.warning(
+                'Regression in %s: throughput x%.2f, p99 latency x%.2f',
+                stage, ratios['throughput_ratio'], ratios['p99_ratio']
+            )
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2))
+        logger.info('Baseline saved to %s', baseline_path)
+    sys.exit(1 if regressions else 0)
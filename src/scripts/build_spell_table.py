@@ -0,0 +1,59 @@
+import os
+import logging
+import argparse
+from collections import Counter
+from multiprocessing import Pool
+import pandas as pd
+from src.transformers import fix_concatenated_words, SpacyTokenizer
+from src.util import PathHelper, CachingSpellChecker, CorrectionTable, set_log_file
+from src.util.typos_processor import repeat_pattern
+
+parser = argparse.ArgumentParser(description='A script that precomputes spelling corrections for the data set vocabulary.')
+parser.add_argument(
+    '--min_count',
+    type=int,
+    default=2,
+    help='Skip words that appear less often than that.'
+)
+parser.add_argument(
+    '--n_jobs',
+    type=int,
+    default=os.cpu_count(),
+    help='Amount of processes for spell checking.'
+)
+
+_spell_checker = None
+
+def _init_worker():
+    global _spell_checker
+    _spell_checker = CachingSpellChecker(
+        cache_size=0, symspell_snapshot=PathHelper.models.symspell_snapshot
+    )
+
+def _correct_word(word):
+    return _spell_checker._correct_word(word)
+
+def build_vocabulary(texts, min_count):
+    # Same normalization as typos_processor applies before spell checking
+    tokenizer = SpacyTokenizer._get_nlp_model().tokenizer
+    counter = Counter()
+    for doc in tokenizer.pipe(fix_concatenated_words(texts), batch_size=5000):
+        counter.update(
+            repeat_pattern.sub(r'\1\1', token.lower_)
+            for token in doc
+            if not token.is_stop and not token.is_punct and not token.is_space
+        )
+    return [word for word, count in counter.items() if count >= min_count]
+
+if __name__ == '__main__':
+    set_log_file(PathHelper.logs.train)
+    logger = logging.getLogger(__name__)
+    args = parser.parse_args()
+
+    df = pd.read_csv(PathHelper.data.raw.data_set)
+    vocabulary = build_vocabulary(df['text'], args.min_count)
+    logger.info('Spell checking %i words', len(vocabulary))
+    with Pool(args.n_jobs, initializer=_init_worker) as pool:
+        corrections = dict(pool.imap_unordered(_correct_word, vocabulary, chunksize=500))
+    CorrectionTable.save(corrections, PathHelper.models.spell_corrections)
+    logger.info('Spell corrections table saved to %s', PathHelper.models.spell_corrections)
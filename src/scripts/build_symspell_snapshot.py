@@ -0,0 +1,11 @@
+import logging
+from src.util import PathHelper, CachingSpellChecker, SymSpellSnapshot, set_log_file
+
+if __name__ == '__main__':
+    set_log_file(PathHelper.logs.train)
+    logger = logging.getLogger(__name__)
+
+    symspell = CachingSpellChecker.load_symspell_dictionary()
+    SymSpellSnapshot.save(symspell, PathHelper.models.symspell_snapshot)
+    logger.info('SymSpell snapshot with %i deletes saved to %s',
+                len(symspell.deletes), PathHelper.models.symspell_snapshot)
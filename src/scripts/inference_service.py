@@ -0,0 +1,24 @@
+import os
+import threading
+from src.scripts.model_load import predict
+from src.util import MicroBatcher, profiler
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_service():
+    """Process wide micro-batching predictor shared by all front ends."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            # METRICS_PORT turns on stage profiling and serves it in Prometheus format
+            metrics_port = os.getenv('METRICS_PORT')
+            if metrics_port:
+                profiler.enable()
+                profiler.serve(int(metrics_port))
+            _service = MicroBatcher(
+                predict,
+                max_batch_size=int(os.getenv('MAX_BATCH_SIZE', '32')),
+                max_wait_ms=float(os.getenv('MAX_BATCH_WAIT_MS', '10'))
+            )
+    return _service
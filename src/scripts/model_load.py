@@ -1,28 +1,111 @@
-# pylint: disable=unused-import
-
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import joblib
 import torch
-from sklearn.preprocessing import LabelEncoder
-from src.util import PathHelper, GPUManager
-from src.pipelines import (
-    preprocessing_pieline,
-    text_vecrotization_pipeline,
-    classification_pipeline
-)
-
-# Hack to load model without GPU
-original_torch_load = torch.load
-device = GPUManager.device()
-torch.load = lambda f, *args, **kwargs: original_torch_load(f, map_location=device, *args, **kwargs)
-
-label_encoder = joblib.load(PathHelper.models.label_encoder)
-preprocessor = joblib.load(PathHelper.models.base_text_preprocessor)
-vectorizer = joblib.load(PathHelper.models.vectorizer, mmap_mode=None)
-classifier = joblib.load(PathHelper.models.sbert_classifier, mmap_mode=None)
+from src.util import PathHelper, GPUManager, profiler
+
+logger = logging.getLogger(__name__)
+
+_torch_load_patched = False
+
+def _patch_torch_load():
+    # Hack to load model without GPU
+    global _torch_load_patched
+    if _torch_load_patched:
+        return
+    original_torch_load = torch.load
+    device = GPUManager.device()
+    torch.load = lambda f, *args, **kwargs: original_torch_load(f, map_location=device, *args, **kwargs)
+    _torch_load_patched = True
+
+def _load_pipeline(path, profile_name):
+    from src.pipelines import ProfiledPipeline
+    # Pipelines trained before profiling was added are plain sklearn Pipelines
+    return ProfiledPipeline.from_pipeline(joblib.load(path, mmap_mode=None), profile_name)
+
+def _load_vectorizer():
+    from src.pipelines import get_sbert_vectorizer
+    pipeline = _load_pipeline(PathHelper.models.vectorizer, 'vectorization')
+    vectorizer = get_sbert_vectorizer(pipeline)
+    # Several app processes may share the cache directory, only training writes to it.
+    # Embeddings computed here are kept in the in-memory LRU of the vectorizer
+    vectorizer.cache_read_only = True
+    # SBERT_BACKEND=onnx switches a vectorizer trained with torch to ONNX Runtime
+    backend = os.getenv('SBERT_BACKEND')
+    quantize = os.getenv('SBERT_QUANTIZE') == '1'
+    if backend and (backend, quantize) != (vectorizer.backend, vectorizer.quantize):
+        vectorizer.set_backend(backend, quantize=quantize)
+    return pipeline
+
+def _load_classifier():
+    from src.pipelines import BoosterPredictor
+    pipeline = joblib.load(PathHelper.models.sbert_classifier, mmap_mode=None)
+    return BoosterPredictor.from_pipeline(
+        pipeline, threshold=float(os.getenv('CLASSIFIER_THRESHOLD', '0.5'))
+    )
+
+def _load_spell_checker():
+    from src.util.typos_processor import get_spell_checker
+    return get_spell_checker()
+
+class Predictor:
+    """
+    Loads model artifacts on first use or on explicit warmup().
+    Components are loaded in parallel threads and their load times are kept in load_times.
+    """
+    def __init__(self):
+        self.loaders = {
+            'label_encoder': lambda: joblib.load(PathHelper.models.label_encoder),
+            'preprocessor': lambda: _load_pipeline(PathHelper.models.base_text_preprocessor, 'preprocessing'),
+            'vectorizer': _load_vectorizer,
+            'classifier': _load_classifier,
+            'spell_checker': _load_spell_checker,
+        }
+        self.components = None
+        self.load_times = {}
+        self._lock = threading.Lock()
+
+    def _load_component(self, name):
+        start = time.perf_counter()
+        component = self.loaders[name]()
+        self.load_times[name] = time.perf_counter() - start
+        logger.info('%s loaded in %.2f sec', name, self.load_times[name])
+        return name, component
+
+    def warmup(self):
+        with self._lock:
+            if self.components is not None:
+                return self.load_times
+            start = time.perf_counter()
+            _patch_torch_load()
+            # Import heavy modules once here, before the loader threads unpickle classes from them
+            import src.pipelines  # pylint: disable=import-outside-toplevel,unused-import
+            with ThreadPoolExecutor(len(self.loaders)) as executor:
+                self.components = dict(executor.map(self._load_component, self.loaders))
+            self.load_times['total'] = time.perf_counter() - start
+            logger.info('Model warmup finished in %.2f sec', self.load_times['total'])
+        return self.load_times
+
+    def predict(self, X):
+        self.warmup()
+        rows = len(X)
+        with profiler.stage('predict', rows):
+            with profiler.stage('preprocessor', rows):
+                preprocessed = self.components['preprocessor'].transform(X)
+            with profiler.stage('vectorizer', rows):
+                vectorized = self.components['vectorizer'].transform(preprocessed)
+            with profiler.stage('classifier', rows):
+                predicted = self.components['classifier'].predict(vectorized)
+            decoded = self.components['label_encoder'].inverse_transform(predicted)
+        return decoded
+
+predictor = Predictor()
+
+def warmup():
+    return predictor.warmup()
 
 def predict(X):
-    preprocessed = preprocessor.transform(X)
-    vectorized = vectorizer.transform(preprocessed)
-    predicted = classifier.predict(vectorized)
-    decoded = label_encoder.inverse_transform(predicted)
-    return decoded
+    return predictor.predict(X)
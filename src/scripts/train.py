@@ -1,18 +1,25 @@
+import os
 import logging
 import math
 import argparse
 import joblib
 import optuna
+import numpy as np
 import pandas as pd
+import xgboost as xgb
 from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split, cross_val_score, StratifiedKFold
+from sklearn.model_selection import train_test_split, StratifiedKFold
 from sklearn.metrics import accuracy_score
 from src.transformers import fix_feature_names
-from src.util import PathHelper, set_log_file
+from src.util import (
+    PathHelper, set_log_file, save_features, load_features,
+    frame_fingerprint, save_vectorized, load_vectorized
+)
 from src.pipelines import (
     preprocessing_pieline,
     text_vecrotization_pipeline,
-    classification_pipeline
+    classification_pipeline,
+    vectorization_settings
 )
 
 parser = argparse.ArgumentParser(description='A script that retrains a model.')
@@ -21,6 +28,50 @@ parser.add_argument(
     action='store_true',
     help='Skip preprocessing step and load previous results.'
 )
+parser.add_argument(
+    '--skip_vectorization',
+    action='store_true',
+    help='Reuse vectorized data from the previous run if settings and input are the same.'
+)
+parser.add_argument(
+    '--embedding_cache',
+    action='store_true',
+    help='Reuse SBERT embeddings of already seen text chunks from the on-disk cache.'
+)
+parser.add_argument(
+    '--docs_cache',
+    action='store_true',
+    help='Store parsed spaCy Docs on disk and reuse them in next runs.'
+)
+parser.add_argument(
+    '--selection_cache',
+    action='store_true',
+    help='Reuse feature selection scores computed for the same extra features.'
+)
+parser.add_argument(
+    '--selection_sample_size',
+    type=int,
+    default=None,
+    help='Rows used by mutual information and random forest feature selection.'
+)
+parser.add_argument(
+    '--reduction',
+    choices=['pca', 'svd', 'random'],
+    default=None,
+    help='Reduce SBERT embeddings with PCA, TruncatedSVD or random projection before classification.'
+)
+parser.add_argument(
+    '--reduction_dim',
+    type=int,
+    default=128,
+    help='Embedding dimensions left after the reduction.'
+)
+parser.add_argument(
+    '--n_process',
+    type=int,
+    default=1,
+    help='Amount of processes for spaCy preprocessing and extra features extraction.'
+)
 parser.add_argument(
     '--sample_n',
     type=int,
@@ -33,6 +84,23 @@ parser.add_argument(
     default=30,
     help='Amount of trials for optuna to optimize classification parameters.'
 )
+parser.add_argument(
+    '--optimization_jobs',
+    type=int,
+    default=4,
+    help='Optuna trials running in parallel, CPU cores are split between them.'
+)
+parser.add_argument(
+    '--early_stopping_rounds',
+    type=int,
+    default=50,
+    help='Stop the final fit when validation logloss has not improved for this many rounds, 0 disables it.'
+)
+parser.add_argument(
+    '--optuna_storage',
+    default=None,
+    help='Optuna storage URL (e.g. sqlite:///logs/optuna.db) to keep the study and resume it later.'
+)
 set_log_file(PathHelper.logs.train)
 logger = logging.getLogger(__name__)
 args = parser.parse_args()
@@ -49,25 +117,47 @@ joblib.dump(le, PathHelper.models.label_encoder)
 TEST_SIZE = 0.3
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=TEST_SIZE, random_state=42, stratify=y)
 
-text_vecrotization = text_vecrotization_pipeline()
+embedding_cache_dir = None
+if args.embedding_cache:
+    # Keep the path relative so the pickled vectorizer finds the cache on any machine
+    embedding_cache_dir = PathHelper.cache.embeddings.relative_to(PathHelper.project_root)
+text_vecrotization = text_vecrotization_pipeline(
+    embedding_cache_dir,
+    reduction=args.reduction,
+    reduction_dim=args.reduction_dim
+)
 
 if not args.skip_preprocessing:
-    preprocessing = preprocessing_pieline()
+    preprocessing = preprocessing_pieline(
+        n_process=args.n_process,
+        streaming=True,
+        n_jobs=args.n_process,
+        docs_cache_dir=PathHelper.cache.docs if args.docs_cache else None,
+        selection_cache_dir=PathHelper.cache.feature_selection if args.selection_cache else None,
+        selection_sample_size=args.selection_sample_size
+    )
     X_train_transformed = preprocessing.fit_transform(X_train, y_train)
+    X_test_transformed = preprocessing.transform(X_test)
+    # Single messages at inference time don't benefit from worker processes or Docs cache
+    preprocessing.set_params(
+        tokenizer__n_process=1,
+        tokenizer__cache_dir=None,
+        features_extractor__n_jobs=1
+    )
     joblib.dump(preprocessing, PathHelper.models.base_text_preprocessor)
+
     fix_feature_names(X_train_transformed)
-    X_train_transformed.to_csv(PathHelper.data.processed.x_train)
-    y_train.to_csv(PathHelper.data.processed.y_train)
+    save_features(X_train_transformed, PathHelper.data.processed.x_train)
+    save_features(pd.DataFrame({'class': y_train}), PathHelper.data.processed.y_train)
 
-    X_test_transformed = preprocessing.transform(X_test)
     fix_feature_names(X_test_transformed)
-    X_test_transformed.to_csv(PathHelper.data.processed.x_test)
-    y_test.to_csv(PathHelper.data.processed.y_test)
+    save_features(X_test_transformed, PathHelper.data.processed.x_test)
+    save_features(pd.DataFrame({'class': y_test}), PathHelper.data.processed.y_test)
 else:
-    X_train_transformed = pd.read_csv(PathHelper.data.processed.x_train)
-    X_test_transformed = pd.read_csv(PathHelper.data.processed.x_test)
-    y_train = pd.read_csv(PathHelper.data.processed.y_train)['class']
-    y_test = pd.read_csv(PathHelper.data.processed.y_test)['class']
+    X_train_transformed = load_features(PathHelper.data.processed.x_train)
+    X_test_transformed = load_features(PathHelper.data.processed.x_test)
+    y_train = load_features(PathHelper.data.processed.y_train)['class']
+    y_test = load_features(PathHelper.data.processed.y_test)['class']
     if args.sample_n:
         train_n = math.ceil(args.sample_n * (1 - TEST_SIZE))
         test_n = math.ceil(args.sample_n * TEST_SIZE)
@@ -76,11 +166,37 @@ else:
         y_train = y_train.loc[X_train_transformed.index]
         y_test = y_test.loc[X_test_transformed.index]
 
-X_train_vectorized = text_vecrotization.fit_transform(X_train_transformed)
-joblib.dump(text_vecrotization, PathHelper.models.vectorizer)
-X_test_vectorized = text_vecrotization.transform(X_test_transformed)
+settings = vectorization_settings(text_vecrotization)
+train_manifest = {**settings, 'input_hash': frame_fingerprint(X_train_transformed)}
+test_manifest = {**settings, 'input_hash': frame_fingerprint(X_test_transformed)}
+X_train_vectorized, X_test_vectorized = None, None
+if args.skip_vectorization and PathHelper.models.vectorizer.exists():
+    X_train_vectorized = load_vectorized(PathHelper.data.processed.x_train_vectorized, train_manifest)
+    X_test_vectorized = load_vectorized(PathHelper.data.processed.x_test_vectorized, test_manifest)
+
+if X_train_vectorized is None or X_test_vectorized is None:
+    X_train_vectorized = text_vecrotization.fit_transform(X_train_transformed)
+    joblib.dump(text_vecrotization, PathHelper.models.vectorizer)
+    X_test_vectorized = text_vecrotization.transform(X_test_transformed)
+    save_vectorized(X_train_vectorized, PathHelper.data.processed.x_train_vectorized, train_manifest)
+    save_vectorized(X_test_vectorized, PathHelper.data.processed.x_test_vectorized, test_manifest)
+    X_train_vectorized = load_vectorized(PathHelper.data.processed.x_train_vectorized, train_manifest)
+    X_test_vectorized = load_vectorized(PathHelper.data.processed.x_test_vectorized, test_manifest)
+else:
+    logger.info('Vectorization skipped, data loaded from the previous run')
 
 skf = StratifiedKFold(n_splits=3, shuffle=True, random_state=42)
+trial_threads = max(1, (os.cpu_count() or 1) // max(1, args.optimization_jobs))
+
+def make_folds(X, y):
+    # Quantized once and shared by all trials, none of the tuned params changes the histogram bins
+    folds = []
+    y = np.asarray(y)
+    for train_idx, valid_idx in skf.split(X, y):
+        dtrain = xgb.QuantileDMatrix(X[train_idx], y[train_idx], nthread=trial_threads)
+        dvalid = xgb.QuantileDMatrix(X[valid_idx], y[valid_idx], ref=dtrain, nthread=trial_threads)
+        folds.append((dtrain, dvalid, y[valid_idx]))
+    return folds
 
 def objective(trial):
     params = {
@@ -90,24 +206,38 @@ def objective(trial):
         "subsample": trial.suggest_float("subsample", 0.5, 1.0),
         "reg_lambda": trial.suggest_float("reg_lambda", 1e-2, 100.0, log=True),
         "reg_alpha": trial.suggest_float("reg_alpha", 1e-2, 100.0, log=True),
-        "use_label_encoder": False,
-        "eval_metric": "logloss",
+    }
+    booster_params = {
+        **{k: v for k, v in params.items() if k != 'n_estimators'},
+        'objective': 'binary:logistic',
+        'eval_metric': 'logloss',
         'tree_method': 'hist',
-        "n_jobs": 2,
+        'nthread': trial_threads,
     }
-    pipeline = classification_pipeline(params)
-    scores = cross_val_score(
-        pipeline, X_train_vectorized, y_train,
-        cv=skf,
-        scoring='accuracy'
-    )
+    scores = []
+    for step, (dtrain, dvalid, y_valid) in enumerate(folds):
+        booster = xgb.train(booster_params, dtrain, num_boost_round=params['n_estimators'])
+        scores.append(accuracy_score(y_valid, booster.predict(dvalid) > 0.5))
+        # Median pruner compares the running mean with other trials after the same fold
+        trial.report(np.mean(scores), step)
+        if trial.should_prune():
+            raise optuna.TrialPruned()
 
-    return scores.mean()
+    return np.mean(scores)
 
 best_params = None
 if args.optimization_trials > 0:
-    study = optuna.create_study(direction="maximize")
-    study.optimize(objective, n_trials=args.optimization_trials)
+    folds = make_folds(X_train_vectorized, y_train)
+    study = optuna.create_study(
+        direction="maximize",
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5),
+        storage=args.optuna_storage,
+        study_name='sbert_classifier' if args.optuna_storage else None,
+        load_if_exists=args.optuna_storage is not None
+    )
+    # XGBoost releases the GIL while training, so trials in threads run in parallel
+    study.optimize(objective, n_trials=args.optimization_trials, n_jobs=args.optimization_jobs)
+    del folds
 
     logger.info('Best accuracy: %f', study.best_value)
     logger.info('Best params: %s', study.best_params)
@@ -128,10 +258,25 @@ best_params['eval_metric'] = 'logloss'
 best_params['tree_method'] = 'hist'
 best_params['n_jobs'] = 2
 
-xgb = classification_pipeline(best_params)
-xgb.fit(X_train_vectorized, y_train)
-joblib.dump(xgb, PathHelper.models.sbert_classifier)
+X_train_vectorized = np.asarray(X_train_vectorized, dtype=np.float32)
+X_test_vectorized = np.asarray(X_test_vectorized, dtype=np.float32)
+fit_params = {}
+X_fit, y_fit = X_train_vectorized, y_train
+if args.early_stopping_rounds > 0:
+    # With hist XGBClassifier builds QuantileDMatrix for both sets, the validation one reuses the train bins
+    X_fit, X_valid, y_fit, y_valid = train_test_split(
+        X_train_vectorized, np.asarray(y_train), test_size=0.1, random_state=42, stratify=y_train
+    )
+    best_params['early_stopping_rounds'] = args.early_stopping_rounds
+    fit_params = {'clf__eval_set': [(X_valid, y_valid)], 'clf__verbose': False}
+
+classifier = classification_pipeline(best_params)
+classifier.fit(X_fit, y_fit, **fit_params)
+if args.early_stopping_rounds > 0:
+    # Saved in the booster attributes, predict and BoosterPredictor use only trees up to it
+    logger.info('Best iteration: %i of %i', classifier[-1].best_iteration, best_params['n_estimators'])
+joblib.dump(classifier, PathHelper.models.sbert_classifier)
 
-y_pred = xgb.predict(X_test_vectorized)
+y_pred = classifier.predict(X_test_vectorized)
 
 logger.info('Final accuracy: %f', accuracy_score(y_test, y_pred))
@@ -1,9 +1,11 @@
-from .sentece_splitter import fix_concatenated_words
+from .sentece_splitter import fix_concatenated_words, iter_fix_concatenated_words
 from .column_names_fixer import fix_feature_names
 from .spacy_tokenizer import SpacyTokenizer
 from .features_extractor import ExtraFeatures
 from .feature_selector import FeatureSelector
 from .sbert_vectorizer import SbertVectorizer
+from .embedding_reducer import EmbeddingReducer
 
-__all__ = ['fix_concatenated_words', 'SpacyTokenizer', 'fix_feature_names',
-           'ExtraFeatures', 'FeatureSelector', 'SbertVectorizer']
+__all__ = ['fix_concatenated_words', 'iter_fix_concatenated_words', 'SpacyTokenizer',
+           'fix_feature_names', 'ExtraFeatures', 'FeatureSelector', 'SbertVectorizer',
+           'EmbeddingReducer']
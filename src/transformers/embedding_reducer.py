@@ -0,0 +1,42 @@
+import logging
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.decomposition import PCA, TruncatedSVD
+from sklearn.random_projection import GaussianRandomProjection
+from src.util.pickle_compatible import PickleCompatible
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingReducer(BaseEstimator, TransformerMixin, PickleCompatible):
+    """Fitted reduction of SBERT embeddings to n_components float32 columns."""
+    methods = ('pca', 'svd', 'random')
+
+    def __init__(self, method='pca', n_components=128, random_state=42):
+        # 'pca', 'svd' (TruncatedSVD, no centering) or 'random' (Gaussian random projection)
+        self.method = method
+        self.n_components = n_components
+        self.random_state = random_state
+
+    def _make_reducer(self, n_components):
+        if self.method == 'pca':
+            return PCA(n_components, svd_solver='randomized', random_state=self.random_state)
+        if self.method == 'svd':
+            return TruncatedSVD(n_components, random_state=self.random_state)
+        if self.method == 'random':
+            return GaussianRandomProjection(n_components, random_state=self.random_state)
+        raise ValueError(f'Unknown reduction method: {self.method}')
+
+    def fit(self, X, y=None):
+        X = np.asarray(X, dtype=np.float32)
+        n_components = min(self.n_components, *X.shape)
+        self.reducer_ = self._make_reducer(n_components).fit(X)
+        if self.method == 'pca':
+            logger.info(
+                'PCA to %i components keeps %.3f of the variance',
+                n_components, self.reducer_.explained_variance_ratio_.sum()
+            )
+        return self
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        return self.reducer_.transform(X).astype(np.float32, copy=False)
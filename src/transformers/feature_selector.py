@@ -1,18 +1,26 @@
+import hashlib
+import inspect
+import json
+import logging
 import warnings
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
+import sklearn
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.feature_selection import mutual_info_classif, SelectKBest, f_classif
+from sklearn.model_selection import train_test_split
+from src.util.pickle_compatible import PickleCompatible
+from src.util.feature_store import frame_fingerprint
+from src.util.path_helper import resolve_project_path
+
+logger = logging.getLogger(__name__)
 
 def correlation_selection(X, y, feature_names):
-    # combined_df = pd.concat([X, y], axis=1)
-    combined_df = X.copy()
-    combined_df['class'] = y
-    corr_matrix = combined_df.corr(method='pearson')
-    results = {}
-    label_correlations = corr_matrix['class'][feature_names]
+    # Only correlations with the label are needed, not the whole matrix
+    label_correlations = X[feature_names].corrwith(pd.Series(np.asarray(y), index=X.index))
 
     top_features = label_correlations.abs().sort_values(ascending=False)
 
@@ -22,10 +30,10 @@ def correlation_selection(X, y, feature_names):
     ]
     return results
 
-def mutual_information_selection(X, y, feature_names):
+def mutual_information_selection(X, y, feature_names, random_state=42):
     results = {}
 
-    mi_scores = mutual_info_classif(X, y, random_state=42)
+    mi_scores = mutual_info_classif(X, y, random_state=random_state)
     top_indices = np.argsort(mi_scores)[::-1]
     results = [
         (feature_names[i], mi_scores[i])
@@ -34,13 +42,13 @@ def mutual_information_selection(X, y, feature_names):
 
     return results
 
-def random_forest_importance(X, y, feature_names):
+def random_forest_importance(X, y, feature_names, n_estimators=100, max_depth=10, random_state=42):
     results = {}
 
     rf = RandomForestClassifier(
-        n_estimators=100,
-        random_state=42,
-        max_depth=10,
+        n_estimators=n_estimators,
+        random_state=random_state,
+        max_depth=max_depth,
         n_jobs=-1
     )
     rf.fit(X, y)
@@ -66,20 +74,51 @@ def k_best_selection(X, y, _feature_names):
     results = list(zip(feat_names, feat_scores))
     return results
 
-def comprehensive_feature_analysis(X, y, feature_names):
-    methods = {
-        'Mutual Information': mutual_information_selection,
-        'Random Forest': random_forest_importance,
-        'Correlation': correlation_selection,
-        'K Best': k_best_selection,
+methods = {
+    'Mutual Information': mutual_information_selection,
+    'Random Forest': random_forest_importance,
+    'Correlation': correlation_selection,
+    'K Best': k_best_selection,
+}
+# These are slow on many rows and still rank features well on a sample
+sampled_methods = {'Mutual Information', 'Random Forest'}
+
+def _code_fingerprint(func):
+    # Keyword defaults are the method parameters, the source hash covers changes of the code itself
+    params = {
+        name: param.default for name, param in inspect.signature(func).parameters.items()
+        if param.default is not inspect.Parameter.empty
     }
+    source = hashlib.sha1(inspect.getsource(func).encode('utf-8')).hexdigest()
+    return {'params': params, 'source': source}
+
+def subsample(X, y, sample_size):
+    if sample_size is None or len(X) <= sample_size:
+        return X, y
+    y = np.asarray(y)
+    X_sample, _, y_sample, _ = train_test_split(
+        X, y, train_size=sample_size, random_state=42, stratify=y
+    )
+    return X_sample, y_sample
+
+def comprehensive_feature_analysis(X, y, feature_names, n_jobs=1, sample_size=None):
+    X_sample, y_sample = subsample(X, y, sample_size)
+
+    def run(method_name):
+        method_func = methods[method_name]
+        if method_name in sampled_methods:
+            return method_func(X_sample, y_sample, feature_names)
+        return method_func(X, y, feature_names)
+
     all_results = {}
-    for method_name, method_func in methods.items():
-        try:
-            all_results[method_name] = method_func(X, y, feature_names)
-        except Exception as e:
-            print(f"Error in {method_name}: {e}")
-            continue
+    with ThreadPoolExecutor(max(1, n_jobs)) as executor:
+        futures = {name: executor.submit(run, name) for name in methods}
+        for method_name, future in futures.items():
+            try:
+                all_results[method_name] = future.result()
+            except Exception:
+                logger.exception('Feature selection method %s failed', method_name)
+                continue
 
     return all_results
 
@@ -95,10 +134,16 @@ def compare_methods_consensus(all_results, top_k=15):
 
     return consensus[:top_k]
 
-class FeatureSelector(BaseEstimator, TransformerMixin):
-    def __init__(self, top_k=15):
+class FeatureSelector(BaseEstimator, TransformerMixin, PickleCompatible):
+    def __init__(self, top_k=15, n_jobs=4, cache_dir=None, sample_size=None):
         self._important_features = None
         self.top_k = top_k
+        # Selection methods run in that many threads
+        self.n_jobs = n_jobs
+        # Method results are stored there keyed by the input data and settings
+        self.cache_dir = cache_dir
+        # Mutual information and random forest use a stratified sample of that many rows
+        self.sample_size = sample_size
 
     def get_feature_names_out(self, input_features=None):
         return self._important_features.copy()
@@ -109,7 +154,7 @@ class FeatureSelector(BaseEstimator, TransformerMixin):
         with warnings.catch_warnings():
             warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
             extra_feature_names = list(X.columns)
-            results = comprehensive_feature_analysis(X, y, extra_feature_names)
+            results = self._cached_analysis(X, y, extra_feature_names)
             important_features = []
             consensus = compare_methods_consensus(results, top_k=self.top_k)
             features = [feature for feature, rating in consensus]
@@ -117,5 +162,43 @@ class FeatureSelector(BaseEstimator, TransformerMixin):
         self._important_features = list(set(important_features))
         return self
 
+    def _cache_path(self, X, y):
+        digest = hashlib.sha1(frame_fingerprint(X).encode('utf-8'))
+        # Hash values, not object pointers, when labels are strings
+        digest.update(pd.util.hash_array(np.asarray(y)).tobytes())
+        settings = {
+            'sklearn': sklearn.__version__,
+            'sample_size': self.sample_size,
+            'sampled_methods': sorted(sampled_methods),
+            'subsample': _code_fingerprint(subsample),
+            'methods': {name: _code_fingerprint(func) for name, func in methods.items()}
+        }
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode('utf-8'))
+        return resolve_project_path(self.cache_dir) / f'{digest.hexdigest()}.json'
+
+    def _cached_analysis(self, X, y, feature_names):
+        if self.cache_dir is None:
+            return comprehensive_feature_analysis(X, y, feature_names, self.n_jobs, self.sample_size)
+        path = self._cache_path(X, y)
+        if path.exists():
+            logger.info('Feature selection results loaded from %s', path)
+            cached = json.loads(path.read_text())
+            return {name: [tuple(item) for item in result] for name, result in cached.items()}
+        results = comprehensive_feature_analysis(X, y, feature_names, self.n_jobs, self.sample_size)
+        failed = [name for name in methods if name not in results]
+        if failed:
+            # Partial results would be reused by every later run with the same data
+            logger.warning('Feature selection results are not cached, failed methods: %s', failed)
+            return results
+        path.parent.mkdir(parents=True, exist_ok=True)
+        serializable = {
+            name: [(str(feature), float(score)) for feature, score in result]
+            for name, result in results.items()
+        }
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(serializable))
+        tmp_path.replace(path)
+        return results
+
     def transform(self, X):
         return X[self._important_features]
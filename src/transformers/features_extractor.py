@@ -1,22 +1,98 @@
 import logging
+import os
 import re
 import gc
-from collections import Counter
+from collections import Counter, deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
+import spacy
+from spacy.util import minibatch
 from sklearn.base import BaseEstimator, TransformerMixin
-from emot import emot
 from emot.emo_unicode import EMOTICONS_EMO
 from urlextract import URLExtract
 from src.util.typos_processor import typos_processor
+from src.util.emoticon_matcher import get_emoticon_matcher
+from src.util.pickle_compatible import PickleCompatible
+from src.util.doc_serialization import docs_to_bytes, docs_from_bytes
 
 logger = logging.getLogger(__name__)
 
-class ExtraFeatures(BaseEstimator, TransformerMixin):
-    def __init__(self):
+# Per worker process state, created once by _init_worker
+_worker_extractor = None
+_worker_vocab = None
+
+def _init_worker(params):
+    global _worker_extractor, _worker_vocab
+    _worker_extractor = ExtraFeatures(**{**params, 'n_jobs': 1})
+    # Docs are restored with a blank English vocab: lexical attributes such as
+    # is_stop and is_punct come from the language defaults, the rest is stored in DocBin
+    _worker_vocab = spacy.blank('en').vocab
+
+def _extract_shard(data):
+    docs = docs_from_bytes(data, _worker_vocab)
+    return _worker_extractor.extract(docs)
+
+url_pattern = re.compile(
+    # Not a part of a word, an e-mail or a longer host name
+    r'(?<![\w@.-])(?:'
+    # URLExtract finds localhost only after a scheme
+    r'[a-z][a-z0-9+.-]*://localhost(?![\w.-])'
+    r'|(?:[a-z][a-z0-9+.-]*://)?'
+    r'(?:(?:[^\W_](?:[\w-]*[^\W_])?\.)+(?P<tld>xn--[a-z0-9]+|[^\W\d_]{2,63})(?![\w-])'
+    r'|\d{1,3}(?:\.\d{1,3}){3}(?![\w.])))'
+    r'(?::\d{1,5})?'
+    # A path runs to the next space like in URLExtract, trailing punctuation is not a part of it.
+    # Without a path only the characters URLExtract allows after a TLD may follow
+    r'(?:[/?#][^\s"<>;|]*(?<![.,!?:;])|(?=[\s"\'<>?.,|)}\]\\`]|:(?!\d)|$))',
+    re.IGNORECASE
+)
+
+_tld_extractor = None
+
+@lru_cache(maxsize=65536)
+def _is_known_tld(tld):
+    # Same TLD list URLExtract uses, asked through its public API: a bare host is a URL only with a known TLD
+    global _tld_extractor
+    if _tld_extractor is None:
+        _tld_extractor = URLExtract()
+    return _tld_extractor.has_urls(f'example.{tld}')
+
+_upper_table = None
+
+def _is_upper(codes):
+    # Same result as chr(code).isupper() for every code point, with a lookup table for the BMP
+    global _upper_table
+    if _upper_table is None:
+        _upper_table = np.array([chr(code).isupper() for code in range(0x10000)])
+    # Most characters are ASCII, only the rest go through the tables
+    result = (codes - ord('A')) < 26
+    non_ascii = np.flatnonzero(codes > 0x7F)
+    bmp = non_ascii[codes[non_ascii] <= 0xFFFF]
+    result[bmp] = _upper_table[codes[bmp]]
+    astral = non_ascii[codes[non_ascii] > 0xFFFF]
+    if len(astral):
+        unique_codes, inverse = np.unique(codes[astral], return_inverse=True)
+        result[astral] = np.array([chr(code).isupper() for code in unique_codes])[inverse]
+    return result
+
+class ExtraFeatures(BaseEstimator, TransformerMixin, PickleCompatible):
+    # Consecutive columns of the feature matrix filled by base_stat_batch
+    base_feature_names = [
+        'length', 'upcase_rate', 'exc_mark_rate', 'q_mark_rate', 'dots_rate', 'new_lines_rate'
+    ]
+    base_stat_batch_size = 1024
+
+    def __init__(self, n_jobs=1, shard_size=500, url_mode='accurate'):
+        # Amount of worker processes, -1 means all CPUs
+        self.n_jobs = n_jobs
+        self.shard_size = shard_size
+        # 'fast' finds URLs with a regex, 'accurate' with URLExtract.
+        # Accurate is the default so extractors pickled before the fast mode keep their features
+        self.url_mode = url_mode
         self.repeat_pattern = re.compile(r'(\w)\1{2,}', re.IGNORECASE)
         self.censorshop_pattern = re.compile(r"[^\w\s'\-:]+")
-        self.emot_obj = emot()
         self.emotions = set(EMOTICONS_EMO.keys())
         self.emot_meanings = set(EMOTICONS_EMO.values())
         self.url_extractor = URLExtract()
@@ -33,6 +109,24 @@ class ExtraFeatures(BaseEstimator, TransformerMixin):
         return self
 
     def replace_urls(self, text):
+        if self.url_mode == 'accurate':
+            return self.replace_urls_accurate(text)
+        # Every URL but localhost has a dot in its host name, most texts have no URLs at all
+        if '.' not in text and '://' not in text:
+            return text, 0
+        urls_counter = 0
+
+        def replace(match):
+            nonlocal urls_counter
+            tld = match.group('tld')
+            if tld is not None and not _is_known_tld(tld.lower()):
+                return match.group()
+            urls_counter += 1
+            return '[l]'
+
+        return url_pattern.sub(replace, text), urls_counter
+
+    def replace_urls_accurate(self, text):
         urls = self.url_extractor.find_urls(text)
         urls = [u.rstrip('.,!?:;') for u in urls]
         urls_counter = len(urls)
@@ -67,58 +161,141 @@ class ExtraFeatures(BaseEstimator, TransformerMixin):
             'new_lines_rate': new_lines / sentences_count
         }
 
+    def base_stat_batch(self, texts, sentences_counts, out=None):
+        """base_stat for many texts at once, columns follow base_feature_names."""
+        if out is None:
+            out = np.zeros((len(texts), len(self.base_feature_names)))
+        lengths = np.array([len(text) for text in texts], dtype=np.int64)
+        ends = np.cumsum(lengths)
+        codes = np.frombuffer(''.join(texts).encode('utf-32-le', errors='surrogatepass'), dtype=np.uint32)
+
+        def segment_counts(mask):
+            # Map positions of matching characters to the texts they belong to
+            segments = np.searchsorted(ends, np.flatnonzero(mask), side='right')
+            return np.bincount(segments, minlength=len(texts))
+
+        sentences_counts = np.maximum(1, np.asarray(sentences_counts, dtype=np.float64))
+        out[:, 0] = np.maximum(1, lengths)
+        out[:, 1] = segment_counts(_is_upper(codes)) / sentences_counts
+        for column, char in enumerate(['!', '?', '.', '\n'], start=2):
+            out[:, column] = segment_counts(codes == ord(char)) / sentences_counts
+        return out
+
     def emoticons_stat(self, text):
         emot_counts = Counter({item: 0 for item in self.emot_meanings})
-        detected = self.emot_obj.emoticons(text)
-        if detected['flag']:
-            emot_counts.update(detected['mean'])
+        emot_counts.update(get_emoticon_matcher().count_meanings(text))
         return emot_counts
 
     def typos_stat_and_fix(self, doc):
-        tokens = [token for token in doc if not token.is_punct]
-
-        emot_cache = {}
-        def get_emoticon_flag(text):
-            if text not in emot_cache:
-                emot_cache[text] = self.emot_obj.emoticons(text)['flag']
-            return emot_cache[text]
-
-        tokens = [t.lemma_.lower() if not get_emoticon_flag(t.text) else t.text for t in tokens]
-        censorship = sum(1 for t in tokens if not get_emoticon_flag(t) and self.censorshop_pattern.findall(t))
-        corrected_text = typos_processor(doc)
+        matcher = get_emoticon_matcher()
+        # Token flags are computed once and shared with typos_processor
+        emoticon_flags = matcher.token_flags(doc)
+        tokens = [
+            t.lemma_.lower() if not flag else t.text
+            for t, flag in zip(doc, emoticon_flags)
+            if not t.is_punct
+        ]
+        censorship = sum(1 for t in tokens if not matcher.flag(t) and self.censorshop_pattern.findall(t))
+        corrected_text = typos_processor(doc, emoticon_flags)
         return {
             'text': corrected_text,
             'censured': censorship,
             'compression': max(0, len(doc.text) - len(corrected_text))
         }
 
-    def transform(self, X):
-        feats = []
-        logger.info('Extra features extraction start')
-        total_messages = len(X)
+    def _row_features(self, doc):
+        # Everything except base_stat, which is computed for batches of rows
+        text, urls_counter = self.replace_urls(doc.text)
+        sentence_feats = self.sentences_stat(doc)
+        emot_feats = self.emoticons_stat(text)
+        typos_feats = self.typos_stat_and_fix(doc)
+
+        return text, {
+            **sentence_feats,
+            "urls_counter": urls_counter,
+            **emot_feats,
+            **typos_feats
+        }
+
+    def extract_row(self, doc):
+        text, feats = self._row_features(doc)
+        return {**self.base_stat(text, feats['sentences_count']), **feats}
+
+    @property
+    def numeric_feature_names(self):
+        return [name for name in self.feature_names_ if name != 'text']
+
+    def extract(self, X):
+        # X can be a lazy stream of Docs, rows are written into a preallocated
+        # matrix as soon as each Doc is produced, so Docs don't pile up in memory
+        total_messages = len(X) if hasattr(X, '__len__') else 0
         milestones = [0.25, 0.5, 0.75]
-        real_milestones = [int(total_messages * m) for m in milestones]
+        real_milestones = [int(total_messages * m) for m in milestones] if total_messages else []
+        numeric_names = self.numeric_feature_names
+        base_start = numeric_names.index(self.base_feature_names[0])
+        base_indices = range(base_start, base_start + len(self.base_feature_names))
+        base_columns = slice(base_indices.start, base_indices.stop)
+        row_columns = [i for i in range(len(numeric_names)) if i not in base_indices]
+        row_names = [numeric_names[i] for i in row_columns]
+        # float64 like before batching, so pipelines trained on earlier versions get the same features
+        feats = np.zeros((max(total_messages, 1), len(numeric_names)))
+        texts = []
+        pending_texts, pending_sentences = [], []
+        n_rows = 0
+
+        def flush_base_stat():
+            start = n_rows - len(pending_texts)
+            self.base_stat_batch(pending_texts, pending_sentences, out=feats[start:n_rows, base_columns])
+            pending_texts.clear()
+            pending_sentences.clear()
+
         for i, doc in enumerate(X):
             if i in real_milestones:
                 j = real_milestones.index(i)
                 logger.info('Extra features finalized %f of total records', milestones[j])
-            text = doc.text
-            text, urls_counter = self.replace_urls(text)
-            sentence_feats = self.sentences_stat(doc)
-            base_feats = self.base_stat(text, sentence_feats['sentences_count'])
-            emot_feats = self.emoticons_stat(text)
-            typos_feats = self.typos_stat_and_fix(doc)
-
-            feats_row = {
-                **base_feats,
-                **sentence_feats,
-                "urls_counter": urls_counter,
-                **emot_feats,
-                **typos_feats
-            }
-            row = [feats_row.get(name, 0) for name in self.feature_names_]
-            feats.append(row)
+            if i >= len(feats):
+                feats = np.vstack([feats, np.zeros_like(feats)])
+            text, feats_row = self._row_features(doc)
+            feats[i, row_columns] = [feats_row.get(name, 0) for name in row_names]
+            texts.append(feats_row['text'])
+            pending_texts.append(text)
+            pending_sentences.append(feats_row['sentences_count'])
+            n_rows = i + 1
+            if len(pending_texts) >= self.base_stat_batch_size:
+                flush_base_stat()
+        if pending_texts:
+            flush_base_stat()
+        return feats[:n_rows], texts
+
+    def extract_parallel(self, X):
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+        feats, texts = [], []
+        pending = deque()
+        params = self.get_params()
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(params,)) as executor:
+            # Keep a bounded amount of shards in flight and collect them in submission order
+            for shard in minibatch(X, self.shard_size):
+                pending.append(executor.submit(_extract_shard, docs_to_bytes(shard)))
+                if len(pending) >= 2 * n_jobs:
+                    shard_feats, shard_texts = pending.popleft().result()
+                    feats.append(shard_feats)
+                    texts.extend(shard_texts)
+            while pending:
+                shard_feats, shard_texts = pending.popleft().result()
+                feats.append(shard_feats)
+                texts.extend(shard_texts)
+        if not feats:
+            return np.zeros((0, len(self.numeric_feature_names))), texts
+        return np.vstack(feats), texts
+
+    def transform(self, X):
+        logger.info('Extra features extraction start')
+        if self.n_jobs == 1:
+            feats, texts = self.extract(X)
+        else:
+            feats, texts = self.extract_parallel(X)
         gc.collect()
         logger.info('Extra features extraction finish')
-        result = pd.DataFrame(feats, columns=self.feature_names_)
+        result = pd.DataFrame(feats, columns=self.numeric_feature_names)
+        result.insert(self.feature_names_.index('text'), 'text', texts)
         return result
@@ -1,83 +1,314 @@
 import logging
+import platform
 import re
+from bisect import bisect_left
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
 from sklearn.base import BaseEstimator, TransformerMixin
 from transformers import logging as hf_logging
-from src.util import GPUManager
+from src.util.pickle_compatible import PickleCompatible
+from src.util import GPUManager, EmbeddingCache, PathHelper, profiler
+from src.util.path_helper import resolve_project_path
 
 logger = logging.getLogger(__name__)
+sentence_end_pattern = re.compile(r'(?<=[.!?])\s+')
 
-class SbertVectorizer(BaseEstimator, TransformerMixin, GPUManager):
-    def __init__(self, model_name='sentence-transformers/all-mpnet-base-v2'):
+class SbertVectorizer(BaseEstimator, TransformerMixin, PickleCompatible, GPUManager):
+    # Chunk boundaries by priority. Punctuation without spaces could be a sign of censorship.
+    # A class constant, so vectorizers pickled before it was introduced still chunk
+    separators = ("\n\n", "\n", ",", " ", "!", ".", "?", "'")
+
+    def __init__(self, model_name='sentence-transformers/all-mpnet-base-v2',
+                 batch_size=512, cross_document=True, cache_dir=None, cache_size_mb=1024,
+                 backend='torch', quantize=False, onnx_dir=None, cache_read_only=False, cache_memory_mb=64):
         self.model_name = model_name
-        self.model = SentenceTransformer(self.model_name, device=GPUManager.device())
-        self.tokenizer = self.model.tokenizer
+        self.batch_size = batch_size
+        # Encode chunks of all documents as one queue instead of one encode call per document
+        self.cross_document = cross_document
+        # Relative cache paths are resolved against the project root
+        self.cache_dir = cache_dir
+        self.cache_size_mb = cache_size_mb
+        # Serving processes only read the cache, new embeddings are stored by training.
+        # Read-only processes keep their new embeddings in an in-memory LRU of cache_memory_mb
+        self.cache_read_only = cache_read_only
+        self.cache_memory_mb = cache_memory_mb
+        self._embedding_cache = None
+        # 'torch' or 'onnx'. ONNX Runtime runs on CPU only
+        self.backend = backend
+        # Dynamic int8 quantization of the ONNX model
+        self.quantize = quantize
+        # Exported ONNX models are kept there, models/onnx by default
+        self.onnx_dir = onnx_dir
+        self._set_model()
         self.chunk_token_size = self.model.max_seq_length - 50
         logger.info('Max seq length: %i', self.chunk_token_size)
         self.overlap = int(self.chunk_token_size * 0.2)
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_token_size,
-            chunk_overlap=self.overlap,
-            length_function=self._token_length,
-            # Punctuation without spaces. Could be a sign of censorship
-            separators=["\n\n", "\n", ",", " ", "!", ".", "?", "'"]
+
+    def _set_model(self):
+        self.model = self._load_model()
+        self.tokenizer = self.model.tokenizer
+
+    def _load_model(self):
+        if self.backend == 'torch':
+            return SentenceTransformer(self.model_name, device=GPUManager.device())
+        if self.backend != 'onnx':
+            raise ValueError(f'Unknown SBERT backend: {self.backend}')
+        export_dir = self._onnx_export_dir()
+        file_name = 'onnx/model_quantized.onnx' if self.quantize else 'onnx/model.onnx'
+        if not (export_dir / file_name).exists():
+            self._export_onnx(export_dir)
+        return SentenceTransformer(
+            str(export_dir), backend='onnx', device='cpu', model_kwargs={'file_name': file_name}
         )
 
+    def _onnx_export_dir(self):
+        onnx_dir = resolve_project_path(self.onnx_dir or PathHelper.models.onnx)
+        return onnx_dir / self.model_name.replace('/', '__')
+
+    def _export_onnx(self, export_dir):
+        logger.info('Exporting %s to ONNX, quantize=%s', self.model_name, self.quantize)
+        model = SentenceTransformer(self.model_name, backend='onnx', device='cpu')
+        model.save_pretrained(str(export_dir))
+        if self.quantize:
+            arm = platform.machine().lower() in ('arm64', 'aarch64')
+            export_dynamic_quantized_onnx_model(
+                model, 'arm64' if arm else 'avx2', str(export_dir), file_suffix='quantized'
+            )
+
+    def set_backend(self, backend, quantize=False):
+        self.backend = backend
+        self.quantize = quantize
+        self._embedding_cache = None
+        self._set_model()
+        return self
+
+    def _model_key(self):
+        # Backends produce slightly different embeddings. Torch keeps the plain name, so old caches stay valid
+        if self.backend == 'torch':
+            return self.model_name
+        return f'{self.model_name}|{self.backend}' + ('|int8' if self.quantize else '')
+
+    def vectorization_settings(self):
+        # Everything that changes the produced embeddings
+        return {
+            'model_name': self._model_key(),
+            'chunk_token_size': self.chunk_token_size,
+            'overlap': self.overlap,
+            'separators': list(self.separators)
+        }
+
     def _token_length(self, text):
         return len(self.tokenizer.encode(text, add_special_tokens=True))
 
-    def _chunk_text_by_tokens(self, text):
+    def _tokens_offsets(self, texts):
+        if not self.tokenizer.is_fast:
+            raise ValueError('Chunking requires a fast tokenizer with offsets mapping')
         # Token indices sequence length is longer...
         # Disable this message here because we're not going to run this sequence through the model
         logging_level = hf_logging.get_verbosity()
         hf_logging.set_verbosity_error()
-        n_tokens = self._token_length(text)
-        sentences = None
-        if n_tokens > self.chunk_token_size:
-            sentences = re.split(r'(?<=[.!?])\s+', text)
-        else:
-            return [text]
+        try:
+            encoded = self.tokenizer(
+                texts,
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+                return_attention_mask=False,
+                return_token_type_ids=False
+            )
+        finally:
+            self.tokenizer.deprecation_warnings.pop(
+                "sequence-length-is-longer-than-the-specified-maximum",
+                None
+            )
+            # And enable logging again because we want to know if there is a long chunk
+            hf_logging.set_verbosity(logging_level)
+        return encoded['offset_mapping']
+
+    def _break_priority(self, text, offsets, i):
+        # Priority of a chunk boundary placed right before token i
+        gap = text[offsets[i - 1][1]:offsets[i][0]]
+        prev_token = text[offsets[i - 1][0]:offsets[i - 1][1]]
+        for priority, sep in enumerate(self.separators):
+            if sep in gap or (not sep.isspace() and prev_token.endswith(sep)):
+                return priority
+        return len(self.separators)
+
+    def _best_break(self, text, offsets, first, last):
+        best, best_priority = last, None
+        for i in range(last, first - 1, -1):
+            priority = self._break_priority(text, offsets, i)
+            if best_priority is None or priority < best_priority:
+                best, best_priority = i, priority
+                if priority == 0:
+                    break
+        return best
+
+    def _overlap_start(self, text, offsets, start, stop):
+        for i in range(max(start + 1, stop - self.overlap), stop):
+            if text[offsets[i - 1][1]:offsets[i][0]].isspace():
+                return i
+        return stop
+
+    def _split_tokens_span(self, text, offsets, start, end, limit):
         chunks = []
-        for sent in sentences:
-            chunks.extend(self.splitter.split_text(sent))
-        self.tokenizer.deprecation_warnings.pop(
-            "sequence-length-is-longer-than-the-specified-maximum",
-            None
-        )
-        # And enable logging again because we want to know if there is a long chunk
-        hf_logging.set_verbosity(logging_level)
+        prev_stop = start
+        while start < end:
+            if end - start <= limit:
+                stop = end
+            else:
+                stop = self._best_break(text, offsets, prev_stop + 1, start + limit)
+            chunk = text[offsets[start][0]:offsets[stop - 1][1]].strip()
+            if chunk:
+                chunks.append(chunk)
+            if stop >= end:
+                break
+            prev_stop = stop
+            start = self._overlap_start(text, offsets, start, stop)
+        return chunks
+
+    def _chunk_long_text(self, text, offsets, limit):
+        token_starts = [start for start, _ in offsets]
+        chunks = []
+        sent_start = 0
+        sent_bounds = [m.span() for m in sentence_end_pattern.finditer(text)] + [(len(text), len(text))]
+        for sent_end, next_start in sent_bounds:
+            first = bisect_left(token_starts, sent_start)
+            last = bisect_left(token_starts, sent_end)
+            if last - first <= limit:
+                sentence = text[sent_start:sent_end].strip()
+                if sentence:
+                    chunks.append(sentence)
+            else:
+                chunks.extend(self._split_tokens_span(text, offsets, first, last, limit))
+            sent_start = next_start
         return chunks
 
+    def _chunk_texts(self, texts):
+        limit = self.chunk_token_size - self.tokenizer.num_special_tokens_to_add(pair=False)
+        result = []
+        for text, offsets in zip(texts, self._tokens_offsets(texts)):
+            if len(offsets) <= limit:
+                result.append([text])
+            else:
+                result.append(self._chunk_long_text(text, offsets, limit))
+        return result
+
+    def _chunk_text_by_tokens(self, text):
+        return self._chunk_texts([text])[0]
+
     def _agg_embeddings(self, chunks, embeddings):
         lengths = np.array([len(c) for c in chunks], dtype=float)
         weights = lengths / lengths.sum()
         return (embeddings * weights[:, None]).sum(axis=0)
 
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('_embedding_cache', None)
+        if state.get('backend') == 'onnx':
+            # ONNX Runtime sessions can't be pickled, the model is loaded from the export again
+            state.pop('model', None)
+            state.pop('tokenizer', None)
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if 'model' not in self.__dict__:
+            self._set_model()
+
+    def _get_embedding_cache(self):
+        if self.cache_dir is None:
+            return None
+        if getattr(self, '_embedding_cache', None) is None:
+            try:
+                self._embedding_cache = EmbeddingCache(
+                    resolve_project_path(self.cache_dir),
+                    self._model_key(),
+                    self.model.get_sentence_embedding_dimension(),
+                    max_size_mb=self.cache_size_mb,
+                    read_only=self.cache_read_only,
+                    memory_size_mb=self.cache_memory_mb
+                )
+            except OSError as e:
+                logger.warning('Embedding cache disabled: %s', e)
+                self.cache_dir = None
+        return self._embedding_cache
+
+    def _encode(self, chunks):
+        cache = self._get_embedding_cache()
+        if cache is None:
+            return self._model_encode(chunks)
+        embeddings, found = cache.lookup(chunks)
+        missing = [chunk for chunk, is_found in zip(chunks, found) if not is_found]
+        if missing:
+            unique_missing = list(dict.fromkeys(missing))
+            encoded = self._model_encode(unique_missing)
+            cache.put(unique_missing, encoded)
+            encoded_map = dict(zip(unique_missing, encoded))
+            embeddings[~found] = [encoded_map[chunk] for chunk in missing]
+        return embeddings
+
+    def _model_encode(self, chunks):
+        return self.model.encode(
+            chunks,
+            device=GPUManager.device(),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+
+    def _empty_embedding(self):
+        return np.zeros(self.model.get_sentence_embedding_dimension())
+
+    def _transform_per_document(self, X):
+        X_encoded = []
+        for x in X:
+            with profiler.stage('sbert.chunking', 1):
+                chunks = self._chunk_text_by_tokens(x)
+            if not chunks:
+                X_encoded.append(self._empty_embedding())
+                continue
+            with profiler.stage('sbert.encoding', len(chunks)):
+                chunk_embeddings = self._encode(chunks)
+            wegihted_embeddings = self._agg_embeddings(chunks, chunk_embeddings)
+            X_encoded.append(wegihted_embeddings)
+        return X_encoded
+
+    def _transform_cross_document(self, X):
+        with profiler.stage('sbert.chunking', len(X)):
+            docs_chunks = self._chunk_texts(X)
+        all_chunks = [chunk for chunks in docs_chunks for chunk in chunks]
+        offsets = np.cumsum([0] + [len(chunks) for chunks in docs_chunks])
+        # SentenceTransformer.encode sorts its input by length before batching,
+        # so a single call over all chunks already minimises padding
+        with profiler.stage('sbert.encoding', len(all_chunks)):
+            all_embeddings = self._encode(all_chunks) if all_chunks else None
+        X_encoded = []
+        for i, chunks in enumerate(docs_chunks):
+            if not chunks:
+                X_encoded.append(self._empty_embedding())
+                continue
+            chunk_embeddings = all_embeddings[offsets[i]:offsets[i + 1]]
+            X_encoded.append(self._agg_embeddings(chunks, chunk_embeddings))
+        return X_encoded
+
     def fit(self, X, y=None):
         return self
 
     def transform(self, X):
         logger.info('Start SBERT transform')
-        X_encoded = []
         X = X if isinstance(X, list) else list(X)
-        with GPUManager.gpu_routine(lambda: self.model.to(GPUManager.device()), self.model.cpu):
-            for x in X:
-                chunks = self._chunk_text_by_tokens(x)
-                if not chunks:
-                    emb_dim = self.model.get_sentence_embedding_dimension()
-                    X_encoded.append(np.zeros(emb_dim))
-                    continue
-
-                chunk_embeddings = self.model.encode(
-                    chunks,
-                    device=GPUManager.device(),
-                    batch_size=512,
-                    convert_to_numpy=True,
-                    show_progress_bar=False
-                )
-                wegihted_embeddings = self._agg_embeddings(chunks, chunk_embeddings)
-                X_encoded.append(wegihted_embeddings)
+        if self.backend == 'torch':
+            routine = GPUManager.gpu_routine(lambda: self.model.to(GPUManager.device()), self.model.cpu)
+        else:
+            routine = GPUManager.gpu_routine()
+        with routine:
+            if self.cross_document:
+                X_encoded = self._transform_cross_document(X)
+            else:
+                X_encoded = self._transform_per_document(X)
+        cache = self._get_embedding_cache()
+        if cache is not None:
+            cache.flush()
+            logger.info('Embedding cache stats: %s', cache.stats())
         logger.info('Finish SBERT transform')
         return np.vstack(X_encoded)
@@ -1,19 +1,63 @@
+import os
 import re
+from multiprocessing import Pool
+from src.util.sized_stream import stream_map
 
 concatenated_pattern = re.compile(r"(\w+[^\s\w]+\w{3,}[^\s\w]*)+(?!\s)")
 separators_pattern = re.compile(r'[^\w\s]+')
 
-def fix_concatenated_words(X):
-    result = []
-    for text in X:
-        matches = list(concatenated_pattern.finditer(text))
-        for m in reversed(matches):
-            problematic_sub = m.group(0)
-            separators = separators_pattern.findall(problematic_sub)
-            separators = list(set(separators))
-            separators.sort(reverse=True, key=len)
-            escaped_seps = '|'.join(re.escape(s) for s in separators)
-            fixed_sub = re.sub(f'({escaped_seps})', r'\1 ', problematic_sub)
-            text = text.replace(problematic_sub, fixed_sub)
-        result.append(text.strip())
-    return result
+def _fix_concatenated_text_by_replace(text):
+    # Reference algorithm. str.replace fixes every occurrence of a matched substring,
+    # including occurrences that are not matches themselves
+    matches = list(concatenated_pattern.finditer(text))
+    for m in reversed(matches):
+        problematic_sub = m.group(0)
+        separators = separators_pattern.findall(problematic_sub)
+        separators = list(set(separators))
+        separators.sort(reverse=True, key=len)
+        escaped_seps = '|'.join(re.escape(s) for s in separators)
+        fixed_sub = re.sub(f'({escaped_seps})', r'\1 ', problematic_sub)
+        text = text.replace(problematic_sub, fixed_sub)
+    return text.strip()
+
+def _occurrences(text, sub):
+    starts = []
+    start = text.find(sub)
+    while start >= 0:
+        starts.append(start)
+        start = text.find(sub, start + len(sub))
+    return starts
+
+def _add_space(match):
+    return match.group(0) + ' '
+
+def fix_concatenated_text(text):
+    matches = list(concatenated_pattern.finditer(text))
+    if not matches:
+        return text.strip()
+    match_starts = {}
+    for m in matches:
+        match_starts.setdefault(m.group(0), []).append(m.start())
+    # One substitution pass gives the same result unless a matched substring
+    # also occurs somewhere else, which is rare enough for the slow path
+    if any(_occurrences(text, sub) != starts for sub, starts in match_starts.items()):
+        return _fix_concatenated_text_by_replace(text)
+    parts = []
+    end = 0
+    for m in matches:
+        parts.append(text[end:m.start()])
+        parts.append(separators_pattern.sub(_add_space, m.group(0)))
+        end = m.end()
+    parts.append(text[end:])
+    return ''.join(parts).strip()
+
+def fix_concatenated_words(X, n_jobs=1):
+    if n_jobs == 1:
+        return [fix_concatenated_text(text) for text in X]
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    with Pool(n_jobs) as pool:
+        return pool.map(fix_concatenated_text, X, chunksize=1000)
+
+def iter_fix_concatenated_words(X):
+    # Lazy version for streaming preprocessing, texts are fixed while the next stage consumes them
+    return stream_map(fix_concatenated_text, X)
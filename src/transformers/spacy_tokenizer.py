@@ -1,27 +1,42 @@
 import logging
+import hashlib
+import json
 import spacy
+from spacy.util import minibatch
 from sklearn.base import BaseEstimator, TransformerMixin
 from spacy.language import Language
 from emot.emo_unicode import EMOTICONS_EMO
 from src.util.pickle_compatible import PickleCompatible
-from src.util import GPUManager
+from src.util import GPUManager, SizedStream, docs_to_bytes, docs_from_bytes
+from src.util.path_helper import resolve_project_path
 
 logger = logging.getLogger(__name__)
 
+# Module level function so worker processes started by nlp.pipe(n_process > 1)
+# can import it (and register the component) when the pipeline is unpickled.
+@Language.component("newline_sentencizer")
+def newline_sentencizer(doc):
+    for token in doc:
+        if '\n' in token.text and token.i > 0:
+            doc[token.i].is_sent_start = True
+    return doc
+
 class SpacyTokenizer(BaseEstimator, TransformerMixin, PickleCompatible, GPUManager):
     _nlp_model = None
+    # Kept for pipelines pickled when the component was defined inside the class
+    newline_sentencizer = staticmethod(newline_sentencizer)
 
-    def __init__(self):
+    def __init__(self, n_process=1, batch_size=5000, materialize=True,
+                 cache_dir=None, cache_shard_size=10000):
+        self.n_process = n_process
+        self.batch_size = batch_size
+        # Return a generator of Docs instead of a list when False
+        self.materialize = materialize
+        # Parsed Docs are stored there as DocBin shards keyed by their texts and the pipeline config
+        self.cache_dir = cache_dir
+        self.cache_shard_size = cache_shard_size
         self.nlp = self._get_nlp_model()
 
-    @staticmethod
-    @Language.component("newline_sentencizer")
-    def newline_sentencizer(doc):
-        for token in doc:
-            if '\n' in token.text and token.i > 0:
-                doc[token.i].is_sent_start = True
-        return doc
-
     @classmethod
     def _get_nlp_model(cls):
         if cls._nlp_model is None:
@@ -34,9 +49,61 @@ class SpacyTokenizer(BaseEstimator, TransformerMixin, PickleCompatible, GPUManag
     def fit(self, X, y=None):
         return self
 
-    def transform(self, X):
+    def _pipeline_fingerprint(self):
+        meta = self.nlp.meta
+        tokenizer = self.nlp.tokenizer
+        # Special cases and affix patterns themselves, not just their count
+        patterns = [
+            getattr(getattr(f, '__self__', None), 'pattern', None)
+            for f in (tokenizer.prefix_search, tokenizer.suffix_search, tokenizer.infix_finditer,
+                      tokenizer.token_match, tokenizer.url_match)
+        ]
+        tokenizer_config = json.dumps([tokenizer.rules or {}, patterns], sort_keys=True, default=str)
+        config = [
+            spacy.__version__, meta.get('lang'), meta.get('name'), meta.get('version'),
+            *self.nlp.pipe_names, hashlib.sha1(tokenizer_config.encode('utf-8')).hexdigest()
+        ]
+        return '|'.join(str(item) for item in config)
+
+    def _shard_path(self, cache_dir, fingerprint, texts):
+        digest = hashlib.sha1(fingerprint.encode('utf-8'))
+        for text in texts:
+            digest.update(text.encode('utf-8', errors='surrogatepass'))
+            digest.update(b'\0')
+        return cache_dir / f'{digest.hexdigest()}.spacy'
+
+    def _cached_pipe(self, X):
+        cache_dir = resolve_project_path(self.cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        fingerprint = self._pipeline_fingerprint()
+        hits, misses = 0, 0
+        for shard in minibatch(X, self.cache_shard_size):
+            path = self._shard_path(cache_dir, fingerprint, shard)
+            if path.exists():
+                hits += 1
+                yield from docs_from_bytes(path.read_bytes(), self.nlp.vocab)
+                continue
+            misses += 1
+            docs = list(self.nlp.pipe(shard, batch_size=self.batch_size, n_process=self.n_process))
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_bytes(docs_to_bytes(docs))
+            tmp_path.replace(path)
+            yield from docs
+        logger.info('Docs cache: %i shards loaded, %i shards parsed', hits, misses)
+
+    def _pipe(self, X):
         logger.info('Start spaCy preprocessing...')
         with GPUManager.gpu_routine(spacy.require_gpu, spacy.require_cpu):
-            docs = list(self.nlp.pipe(X, batch_size=5000, n_process=1))
+            if self.cache_dir is None:
+                yield from self.nlp.pipe(X, batch_size=self.batch_size, n_process=self.n_process)
+            else:
+                yield from self._cached_pipe(X)
         logger.info('SpaCy preprocessing finished')
+
+    def transform(self, X):
+        docs = self._pipe(X)
+        if self.materialize:
+            docs = list(docs)
+        elif hasattr(X, '__len__'):
+            docs = SizedStream(docs, len(X))
         return docs
@@ -1,9 +1,24 @@
+from .correction_table import CorrectionTable
+from .symspell_snapshot import SymSpellSnapshot
 from .caching_spell_checker import CachingSpellChecker
+from .emoticon_matcher import EmoticonMatcher, get_emoticon_matcher
 from .pickle_compatible import PickleCompatible
 from .typos_processor import typos_processor
 from .gpu_manager import GPUManager
 from .path_helper import PathHelper
 from .logger_config import set_log_file
+from .embedding_cache import EmbeddingCache
+from .sized_stream import SizedStream, stream_map
+from .doc_serialization import docs_to_bytes, docs_from_bytes
+from .micro_batcher import MicroBatcher
+from .stage_profiler import StageProfiler, profiler
+from .feature_store import (
+    save_features, load_features, frame_fingerprint, save_vectorized, load_vectorized
+)
 
-__all__ = ['CachingSpellChecker', 'PickleCompatible', 'set_log_file',
-           'typos_processor', 'GPUManager', 'PathHelper']
+__all__ = ['CachingSpellChecker', 'CorrectionTable', 'SymSpellSnapshot', 'EmoticonMatcher', 'get_emoticon_matcher',
+           'PickleCompatible', 'set_log_file',
+           'typos_processor', 'GPUManager', 'PathHelper', 'EmbeddingCache',
+           'SizedStream', 'stream_map', 'docs_to_bytes', 'docs_from_bytes',
+           'save_features', 'load_features', 'frame_fingerprint',
+           'save_vectorized', 'load_vectorized', 'MicroBatcher', 'StageProfiler', 'profiler']
@@ -1,29 +1,43 @@
 from functools import lru_cache
-from pathlib import Path
 from symspellpy.symspellpy import SymSpell, Verbosity
 import hunspell
+from src.util.correction_table import CorrectionTable
+from src.util.symspell_snapshot import SymSpellSnapshot
+from src.util.path_helper import PathHelper
 
 class CachingSpellChecker:
-    def __init__(self):
+    def __init__(self, correction_table=None, cache_size=10000, symspell_snapshot=None):
         self.hunspell = hunspell.HunSpell(
             '/usr/share/hunspell/en_US.dic',
             '/usr/share/hunspell/en_US.aff'
         )
-        self.prepare_symspell()
+        self.prepare_symspell(symspell_snapshot)
+        # Precomputed corrections are consulted first, the bounded cache is for words missing there
+        self.correction_table = CorrectionTable.load(correction_table)
+        self._cached_correct_word = lru_cache(maxsize=cache_size)(self._correct_word)
 
-    def prepare_symspell(self):
-        base_dir = Path(__file__).resolve().parent.parent.parent
-        dict_path = base_dir / 'resources/frequency_dictionary_en_82_765.txt'
-        self.symspell = SymSpell(max_dictionary_edit_distance=2, prefix_length=7)
-        self.symspell.load_dictionary(dict_path, term_index=0, count_index=1)
+    def prepare_symspell(self, snapshot=None):
+        # Prebuilt index loads in milliseconds, the text dictionary takes seconds
+        self.symspell = SymSpellSnapshot.load(snapshot, max_dictionary_edit_distance=2, prefix_length=7)
+        if self.symspell is None:
+            self.symspell = self.load_symspell_dictionary()
+
+    @staticmethod
+    def load_symspell_dictionary():
+        symspell = SymSpell(max_dictionary_edit_distance=2, prefix_length=7)
+        symspell.load_dictionary(PathHelper.resources.frequency_dictionary, term_index=0, count_index=1)
+        return symspell
 
     def correct_words(self, words):
         unique_words = set(words)
-        corrections = [self._correct_word(w) for w in unique_words]
-        corrections = dict(corrections)
+        corrections = {}
+        if self.correction_table is not None:
+            corrections = self.correction_table.lookup(unique_words)
+        corrections.update(
+            self._cached_correct_word(w) for w in unique_words if w not in corrections
+        )
         return [corrections.get(w, w) for w in words]
 
-    @lru_cache(maxsize=10000)
     def _correct_word(self, word):
         is_correct = self.hunspell.spell(word)
         corrected = word
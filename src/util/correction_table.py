@@ -0,0 +1,51 @@
+from pathlib import Path
+import numpy as np
+
+class CorrectionTable:
+    """
+    Sorted word -> correction arrays stored as .npy files and opened with mmap,
+    so every process reading the same table shares its pages.
+    """
+    def __init__(self, path):
+        path = Path(path)
+        self.words = np.load(path / 'words.npy', mmap_mode='r')
+        self.corrections = np.load(path / 'corrections.npy', mmap_mode='r')
+        self.width = self.words.dtype.itemsize
+
+    @classmethod
+    def load(cls, path):
+        if path is None or not (Path(path) / 'words.npy').exists():
+            return None
+        return cls(path)
+
+    @staticmethod
+    def save(corrections, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        items = sorted(
+            (word.encode('utf-8'), corrected.encode('utf-8'))
+            for word, corrected in corrections.items()
+        )
+        words = np.array([word for word, _ in items] or [b''])
+        corrected = np.array([corrected for _, corrected in items] or [b''])
+        np.save(path / 'words.npy', words)
+        np.save(path / 'corrections.npy', corrected)
+
+    def __len__(self):
+        return len(self.words)
+
+    def lookup(self, words):
+        """Return corrections for the words that are in the table."""
+        encoded = [(w, w.encode('utf-8')) for w in words]
+        # Longer words would be truncated by the fixed width dtype and match wrong entries
+        encoded = [(w, e) for w, e in encoded if 0 < len(e) <= self.width]
+        if not encoded:
+            return {}
+        queries = np.array([e for _, e in encoded], dtype=self.words.dtype)
+        idx = np.searchsorted(self.words, queries)
+        idx[idx >= len(self.words)] = 0
+        found = np.flatnonzero(self.words[idx] == queries)
+        return {
+            encoded[i][0]: self.corrections[idx[i]].decode('utf-8')
+            for i in found
+        }
@@ -0,0 +1,10 @@
+from spacy.tokens import DocBin
+
+def docs_to_bytes(docs):
+    doc_bin = DocBin(store_user_data=False)
+    for doc in docs:
+        doc_bin.add(doc)
+    return doc_bin.to_bytes()
+
+def docs_from_bytes(data, vocab):
+    return DocBin().from_bytes(data).get_docs(vocab)
@@ -0,0 +1,201 @@
+import json
+import fcntl
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """
+    On-disk cache of chunk embeddings keyed by (model name, chunk text hash).
+    Vectors live in a memory-mapped float32 matrix, keys and last access ticks
+    in small .npy files next to it. When the cache is full the least recently
+    used rows are overwritten.
+
+    A directory has either one writer or any number of read-only users, which is
+    enforced with a file lock held while the cache is open. A writer that can't get
+    the lock opens the cache read-only, a reader that can't get it works without cache.
+    Read-only users keep new embeddings in a bounded in-memory LRU of memory_size_mb instead.
+    """
+    def __init__(self, cache_dir, model_name, dim, max_size_mb=1024, read_only=False, memory_size_mb=64):
+        model_key = hashlib.blake2b(model_name.encode('utf-8'), digest_size=8).hexdigest()
+        self.path = Path(cache_dir) / model_key
+        self.model_name = model_name
+        self.dim = dim
+        self.capacity = max(1, int(max_size_mb * 2**20) // (dim * 4))
+        self.memory_capacity = int(memory_size_mb * 2**20) // (dim * 4)
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.read_only = read_only
+        self.available = True
+        self._lock_file = None
+        self._acquire_file_lock()
+        self._load()
+
+    def _try_file_lock(self, mode):
+        try:
+            fcntl.flock(self._lock_file, mode | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _acquire_file_lock(self):
+        self._lock_file = open(self.path / 'lock', 'a+b')  # pylint: disable=consider-using-with
+        if not self.read_only:
+            if self._try_file_lock(fcntl.LOCK_EX):
+                return
+            logger.warning(
+                'Embedding cache %s is in use by another process, opening it read-only. '
+                'New embeddings will not be stored on disk', self.path
+            )
+            self.read_only = True
+        if not self._try_file_lock(fcntl.LOCK_SH):
+            logger.warning('Embedding cache %s is being written by another process, not using it', self.path)
+            self.available = False
+
+    def close(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    @staticmethod
+    def text_key(text):
+        digest = hashlib.blake2b(text.encode('utf-8', errors='surrogatepass'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def _load(self):
+        meta_path = self.path / 'meta.json'
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        compatible = meta.get('dim') == self.dim and meta.get('capacity') == self.capacity
+        vectors_path = self.path / 'vectors.f32'
+        if compatible and vectors_path.exists() and self.available:
+            self._size = meta['size']
+            self._tick = meta['tick']
+            self._keys = np.load(self.path / 'keys.npy')
+            self._last_used = np.load(self.path / 'last_used.npy')
+            self._vectors = np.memmap(vectors_path, dtype=np.float32, mode='r' if self.read_only else 'r+',
+                                      shape=(self.capacity, self.dim))
+        elif self.read_only:
+            self._size = 0
+            self._tick = 0
+            self._keys = np.zeros(0, dtype=np.uint64)
+            self._last_used = np.zeros(0, dtype=np.int64)
+            self._vectors = None
+        else:
+            if meta:
+                logger.info('Embedding cache settings changed, resetting %s', self.path)
+            self._size = 0
+            self._tick = 0
+            self._keys = np.zeros(self.capacity, dtype=np.uint64)
+            self._last_used = np.zeros(self.capacity, dtype=np.int64)
+            self._vectors = np.memmap(vectors_path, dtype=np.float32, mode='w+',
+                                      shape=(self.capacity, self.dim))
+        self._index = {int(k): row for row, k in enumerate(self._keys[:self._size])}
+
+    def __len__(self):
+        return self._size
+
+    def lookup(self, texts):
+        """Return (embeddings, found) where rows for missing texts are zeros."""
+        keys = [self.text_key(t) for t in texts]
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        with self._lock:
+            self._tick += 1
+            rows = np.array([self._index.get(k, -1) for k in keys], dtype=np.int64)
+            found = rows >= 0
+            if found.any():
+                embeddings[found] = self._vectors[rows[found]]
+                self._last_used[rows[found]] = self._tick
+            if self._memory:
+                for i in np.flatnonzero(~found):
+                    vector = self._memory.get(keys[i])
+                    if vector is not None:
+                        self._memory.move_to_end(keys[i])
+                        embeddings[i] = vector
+                        found[i] = True
+            n_found = int(found.sum())
+            self.hits += n_found
+            self.misses += len(texts) - n_found
+        return embeddings, found
+
+    def _free_rows(self, n):
+        old_size = self._size
+        n_new = min(n, self.capacity - old_size)
+        rows = list(range(old_size, old_size + n_new))
+        self._size += n_new
+        n_evict = n - n_new
+        if n_evict > 0:
+            evicted = np.argpartition(self._last_used[:old_size], n_evict - 1)[:n_evict]
+            for row in evicted:
+                del self._index[int(self._keys[row])]
+            self.evictions += n_evict
+            rows.extend(int(r) for r in evicted)
+        return rows
+
+    def _put_memory(self, keys, embeddings):
+        for key, emb in zip(keys, embeddings):
+            if key not in self._index:
+                # A copy, a view would keep the whole encoded batch alive
+                self._memory[key] = np.array(emb, dtype=np.float32)
+                self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_capacity:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, texts, embeddings):
+        keys = [self.text_key(text) for text in texts]
+        if self.read_only:
+            with self._lock:
+                self._put_memory(keys, embeddings)
+            return
+        with self._lock:
+            # Checked under the lock, otherwise two threads could both store the same key
+            new_items = {}
+            for key, emb in zip(keys, embeddings):
+                if key not in self._index:
+                    new_items[key] = emb
+            # Never evict more than the whole cache in a single call
+            new_items = dict(list(new_items.items())[:self.capacity])
+            if not new_items:
+                return
+            rows = self._free_rows(len(new_items))
+            keys = np.fromiter(new_items.keys(), dtype=np.uint64, count=len(new_items))
+            self._keys[rows] = keys
+            self._last_used[rows] = self._tick
+            self._vectors[rows] = np.asarray(list(new_items.values()), dtype=np.float32)
+            for row, key in zip(rows, new_items):
+                self._index[key] = row
+
+    def flush(self):
+        if self.read_only:
+            return
+        with self._lock:
+            self._vectors.flush()
+            np.save(self.path / 'keys.npy', self._keys)
+            np.save(self.path / 'last_used.npy', self._last_used)
+            meta = {
+                'model_name': self.model_name,
+                'dim': self.dim,
+                'capacity': self.capacity,
+                'size': self._size,
+                'tick': self._tick
+            }
+            (self.path / 'meta.json').write_text(json.dumps(meta))
+
+    def stats(self):
+        return {
+            'size': self._size,
+            'capacity': self.capacity,
+            'memory_size': len(self._memory),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
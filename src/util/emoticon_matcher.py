@@ -0,0 +1,41 @@
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from emot import pattern_generator
+from emot.emo_unicode import EMOTICONS_EMO
+
+class EmoticonMatcher:
+    """
+    Emoticon detection with the same trie regex emot builds, compiled once.
+    Flags of token strings are memoized, so every distinct token is scanned once per process.
+    """
+    def __init__(self, cache_size=100000):
+        generator = pattern_generator.pattern_generator()
+        for emoticon in EMOTICONS_EMO:
+            generator.add(emoticon)
+        self.pattern = re.compile(generator.pattern())
+        self.meanings = {emoticon.strip(): meaning for emoticon, meaning in EMOTICONS_EMO.items()}
+        self.flag = lru_cache(maxsize=cache_size)(self._flag)
+
+    def _flag(self, text):
+        return self.pattern.search(text) is not None
+
+    def find(self, text):
+        return [match.group().strip() for match in self.pattern.finditer(text)]
+
+    def count_meanings(self, text):
+        return Counter(self.meanings[emoticon] for emoticon in self.find(text))
+
+    def token_flags(self, doc):
+        return [self.flag(token.text) for token in doc]
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+def get_emoticon_matcher():
+    global _matcher
+    with _matcher_lock:
+        if _matcher is None:
+            _matcher = EmoticonMatcher()
+    return _matcher
@@ -0,0 +1,34 @@
+import json
+import hashlib
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+def save_features(df, path):
+    # Parquet keeps dtypes and compresses the long text column, unlike CSV
+    df.to_parquet(path, engine='pyarrow', compression='zstd', index=False)
+
+def load_features(path, columns=None):
+    # Only requested columns are read from disk
+    return pd.read_parquet(path, engine='pyarrow', columns=columns, memory_map=True)
+
+def frame_fingerprint(df):
+    digest = hashlib.sha1(','.join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+def _manifest_path(path):
+    return Path(path).with_suffix('.json')
+
+def save_vectorized(X, path, manifest):
+    np.save(path, np.asarray(X, dtype=np.float32))
+    _manifest_path(path).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+
+def load_vectorized(path, manifest):
+    # Returns None if there is no stored array or it was built with other settings or input
+    manifest_path = _manifest_path(path)
+    if not Path(path).exists() or not manifest_path.exists():
+        return None
+    if json.loads(manifest_path.read_text()) != json.loads(json.dumps(manifest, sort_keys=True)):
+        return None
+    return np.load(path, mmap_mode='r')
@@ -0,0 +1,105 @@
+import asyncio
+import contextlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Collects single requests coming from any thread or event loop into batches
+    of up to max_batch_size, waiting at most max_wait_ms for a batch to fill.
+    predict_fn receives a list of inputs and returns a list of results in the same order.
+    """
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=10):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # Model stages run on a dedicated thread, the event loop only coalesces requests
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='predict')
+        self._loop = asyncio.new_event_loop()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name='micro-batcher')
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    async def _start(self):
+        self._queue = asyncio.Queue()
+        self._batch = []
+        self._worker = asyncio.create_task(self._run())
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _predict(self, inputs):
+        results = list(await self._loop.run_in_executor(self._executor, self.predict_fn, inputs))
+        # zip would silently leave the futures of missing results unresolved forever
+        if len(results) != len(inputs):
+            raise ValueError(f'predict_fn returned {len(results)} results for {len(inputs)} inputs')
+        return results
+
+    async def _resolve(self, batch):
+        try:
+            results = await self._predict([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                logger.exception('Prediction failed')
+                batch[0][1].set_exception(e)
+                return
+            # One bad input shouldn't fail the whole batch, so only its future gets the error
+            logger.exception('Batch prediction failed, retrying %i inputs one by one', len(batch))
+            for entry in batch:
+                await self._resolve([entry])
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    async def _run(self):
+        while True:
+            self._batch = await self._next_batch()
+            await self._resolve(self._batch)
+            self._batch = []
+
+    def submit(self, item):
+        if self._closed:
+            raise RuntimeError('MicroBatcher is closed')
+        future = Future()
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (item, future))
+        return future
+
+    def predict_sync(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    async def predict(self, item):
+        return await asyncio.wrap_future(self.submit(item))
+
+    async def _stop(self):
+        self._worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._worker
+        # Requests that were in flight or still queued would otherwise wait forever
+        pending = [future for _, future in self._batch]
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait()[1])
+        for future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError('MicroBatcher is closed'))
+
+    def close(self):
+        self._closed = True
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown()
@@ -2,6 +2,10 @@ from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 
+def resolve_project_path(path):
+    path = Path(path)
+    return path if path.is_absolute() else PROJECT_ROOT / path
+
 class PathConfig:
     def __init_subclass__(cls):
         parts = cls.__qualname__.split('.')[1:]
@@ -18,13 +22,28 @@ class PathHelper(PathConfig):
         base_text_preprocessor = 'base_text_preprocessor.joblib'
         sbert_classifier = 'sbert_classifier.joblib'
         vectorizer = 'vectorizer.joblib'
+        spell_corrections = 'spell_corrections'
+        symspell_snapshot = 'symspell_snapshot'
+        onnx = 'onnx'
     class data(PathConfig):
         class raw(PathConfig):
             data_set = 'Suicide_Detection.csv'
         class processed(PathConfig):
-            x_train = 'X_train_transformed.csv'
-            x_test = 'X_test_transformed.csv'
-            y_train = 'y_train.csv'
-            y_test = 'y_test.csv'
+            x_train = 'X_train_transformed.parquet'
+            x_test = 'X_test_transformed.parquet'
+            y_train = 'y_train.parquet'
+            y_test = 'y_test.parquet'
+            x_train_vectorized = 'X_train_vectorized.npy'
+            x_test_vectorized = 'X_test_vectorized.npy'
+    class resources(PathConfig):
+        frequency_dictionary = 'frequency_dictionary_en_82_765.txt'
     class logs(PathConfig):
         train = 'train.log'
+        benchmark = 'benchmark.log'
+        benchmark_results = 'benchmark_results.json'
+        benchmark_baseline = 'benchmark_baseline.json'
+    class cache(PathConfig):
+        embeddings = 'embeddings'
+        docs = 'docs'
+        feature_selection = 'feature_selection'
+        benchmark_model = 'tiny_sbert'
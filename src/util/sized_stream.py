@@ -0,0 +1,17 @@
+class SizedStream:
+    """Single pass iterable that knows its length, so consumers can preallocate output."""
+    def __init__(self, iterable, length):
+        self.iterable = iterable
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+def stream_map(func, X):
+    result = map(func, X)
+    if hasattr(X, '__len__'):
+        return SizedStream(result, len(X))
+    return result
@@ -0,0 +1,130 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of latency histogram buckets in seconds
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_disabled = nullcontext()
+_page_size = os.sysconf('SC_PAGE_SIZE')
+
+def _current_rss_bytes():
+    # Resident pages right now. ru_maxrss is a process wide high-water mark, so it can't be split per stage
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _page_size
+    except OSError:
+        return 0
+
+class StageProfiler:
+    """
+    Wall time, processed rows and the largest RSS growth per named stage, aggregated into
+    latency histograms. RSS growth is the resident memory after a stage call minus before it,
+    stages running concurrently in other threads are counted too.
+    Disabled profiler only checks a flag per stage.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def stage(self, name, rows=None):
+        if not self.enabled:
+            return _disabled
+        return self._measure(name, rows)
+
+    @contextmanager
+    def _measure(self, name, rows):
+        rss_before = _current_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record(name, elapsed, rows, _current_rss_bytes() - rss_before)
+
+    def record(self, name, seconds, rows=None, rss_growth=None):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = {
+                    'count': 0, 'sum': 0.0, 'rows': 0, 'max_rss_growth_bytes': 0,
+                    'buckets': [0] * (len(latency_buckets) + 1)
+                }
+            stage['count'] += 1
+            stage['sum'] += seconds
+            stage['rows'] += rows or 0
+            stage['max_rss_growth_bytes'] = max(stage['max_rss_growth_bytes'], rss_growth or 0)
+            stage['buckets'][bisect.bisect_left(latency_buckets, seconds)] += 1
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                name: {**stage, 'buckets': list(stage['buckets'])}
+                for name, stage in self._stages.items()
+            }
+
+    def to_json(self):
+        return json.dumps({'buckets': latency_buckets, 'stages': self.to_dict()}, indent=2)
+
+    def to_prometheus(self):
+        lines = ['# TYPE stage_latency_seconds histogram']
+        stages = self.to_dict()
+        for name, stage in stages.items():
+            cumulative = 0
+            for bound, count in zip(latency_buckets + ('+Inf',), stage['buckets']):
+                cumulative += count
+                lines.append(f'stage_latency_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'stage_latency_seconds_sum{{stage="{name}"}} {stage["sum"]}')
+            lines.append(f'stage_latency_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines.append('# TYPE stage_rows_total counter')
+        lines.extend(f'stage_rows_total{{stage="{name}"}} {stage["rows"]}' for name, stage in stages.items())
+        lines.append('# TYPE stage_max_rss_growth_bytes gauge')
+        lines.extend(
+            f'stage_max_rss_growth_bytes{{stage="{name}"}} {stage["max_rss_growth_bytes"]}'
+            for name, stage in stages.items()
+        )
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='0.0.0.0'):
+        """Start a background HTTP server with /metrics (Prometheus) and /metrics.json."""
+        profiler = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = profiler.to_prometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = profiler.to_json(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+# Process wide profiler, STAGE_PROFILING=1 enables it at startup
+profiler = StageProfiler(enabled=os.getenv('STAGE_PROFILING') == '1')
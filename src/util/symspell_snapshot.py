@@ -0,0 +1,105 @@
+import json
+from collections.abc import Mapping
+from pathlib import Path
+import numpy as np
+from symspellpy.symspellpy import SymSpell
+
+class MmapDeletes(Mapping):
+    """
+    Read only view of SymSpell deletes index (delete -> dictionary words)
+    backed by sorted memory-mapped arrays in CSR layout.
+    """
+    def __init__(self, keys, offsets, word_ids, words):
+        self.keys = keys
+        self.offsets = offsets
+        self.word_ids = word_ids
+        self.words = words
+        self.width = keys.dtype.itemsize
+        # SymSpell checks membership right before item access, keep the last search result
+        self._last = (None, -1)
+
+    def _find(self, key):
+        last_key, last_idx = self._last
+        if key == last_key:
+            return last_idx
+        encoded = key.encode('utf-8')
+        idx = -1
+        if len(encoded) <= self.width:
+            pos = int(np.searchsorted(self.keys, encoded))
+            if pos < len(self.keys) and self.keys[pos] == encoded:
+                idx = pos
+        self._last = (key, idx)
+        return idx
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self._find(key) >= 0
+
+    def __getitem__(self, key):
+        idx = self._find(key)
+        if idx < 0:
+            raise KeyError(key)
+        ids = self.word_ids[self.offsets[idx]:self.offsets[idx + 1]]
+        return [self.words[i] for i in ids]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return (key.decode('utf-8') for key in self.keys)
+
+class SymSpellSnapshot:
+    """
+    Prepared SymSpell index saved as .npy files. Loading it skips rebuilding
+    the deletes index from the text dictionary, and the biggest arrays are opened
+    with mmap, so forked workers share their pages.
+    """
+    @staticmethod
+    def save(symspell, path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        words = sorted(symspell.words)
+        word_index = {word: i for i, word in enumerate(words)}
+        keys = sorted(symspell.deletes)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(symspell.deletes[key]) for key in keys])
+        word_ids = np.fromiter(
+            (word_index[word] for key in keys for word in symspell.deletes[key]),
+            dtype=np.int32, count=offsets[-1]
+        )
+        np.save(path / 'words.npy', np.array([w.encode('utf-8') for w in words]))
+        np.save(path / 'counts.npy', np.array([symspell.words[w] for w in words], dtype=np.int64))
+        np.save(path / 'delete_keys.npy', np.array([k.encode('utf-8') for k in keys]))
+        np.save(path / 'delete_offsets.npy', offsets)
+        np.save(path / 'delete_word_ids.npy', word_ids)
+        meta = {
+            'data_version': symspell.data_version,
+            'max_dictionary_edit_distance': symspell._max_dictionary_edit_distance,
+            'prefix_length': symspell._prefix_length,
+            'count_threshold': symspell._count_threshold,
+            'max_length': symspell._max_length
+        }
+        (path / 'meta.json').write_text(json.dumps(meta))
+
+    @staticmethod
+    def load(path, max_dictionary_edit_distance=2, prefix_length=7):
+        """Return a ready SymSpell or None when the snapshot is missing or was built with other settings."""
+        if path is None or not (Path(path) / 'meta.json').exists():
+            return None
+        path = Path(path)
+        meta = json.loads((path / 'meta.json').read_text())
+        symspell = SymSpell(max_dictionary_edit_distance, prefix_length, meta['count_threshold'])
+        settings = (meta['data_version'], meta['max_dictionary_edit_distance'], meta['prefix_length'])
+        if settings != (symspell.data_version, max_dictionary_edit_distance, prefix_length):
+            return None
+        words = [w.decode('utf-8') for w in np.load(path / 'words.npy')]
+        counts = np.load(path / 'counts.npy').tolist()
+        # Lookups use only membership and item access on these two, see SymSpell.lookup
+        symspell._words = dict(zip(words, counts))
+        symspell._deletes = MmapDeletes(
+            np.load(path / 'delete_keys.npy', mmap_mode='r'),
+            np.load(path / 'delete_offsets.npy', mmap_mode='r'),
+            np.load(path / 'delete_word_ids.npy', mmap_mode='r'),
+            words
+        )
+        symspell._max_length = meta['max_length']
+        return symspell
@@ -1,23 +1,40 @@
 import re
-from emot import emot
+import threading
 from src.util import CachingSpellChecker
+from src.util.emoticon_matcher import get_emoticon_matcher
+from src.util.path_helper import PathHelper
+from src.util.stage_profiler import profiler
 
 repeat_pattern = re.compile(r'(\w|[^\w\d\s])\1{2,}', re.IGNORECASE)
-spell_checker = CachingSpellChecker()
-emot_obj = emot()
+_spell_checker = None
+_init_lock = threading.Lock()
 
-def typos_processor(doc):
+def get_spell_checker():
+    # Loading dictionaries takes seconds, so it happens on first use instead of import
+    global _spell_checker
+    with _init_lock:
+        if _spell_checker is None:
+            _spell_checker = CachingSpellChecker(
+                correction_table=PathHelper.models.spell_corrections,
+                symspell_snapshot=PathHelper.models.symspell_snapshot
+            )
+    return _spell_checker
+
+def typos_processor(doc, emoticon_flags=None):
+    if emoticon_flags is None:
+        emoticon_flags = get_emoticon_matcher().token_flags(doc)
+    spell_checker = get_spell_checker()
     tokens = []
     word_tokens = []
-    for token in doc:
-        emotion = emot_obj.emoticons(token.text)['flag']
+    for token, emotion in zip(doc, emoticon_flags):
         token_l = token.text
         if not emotion:
             token_l = repeat_pattern.sub(r'\1\1', token.lower_)
             if not token.is_stop and not token.is_punct and token.lemma_.strip():
                 word_tokens.append(token_l)
         tokens.append(token_l)
-    corrected_words = spell_checker.correct_words(word_tokens)
+    with profiler.stage('spelling', len(word_tokens)):
+        corrected_words = spell_checker.correct_words(word_tokens)
     mapper = dict(zip(word_tokens, corrected_words))
     tokens = [mapper.get(t, t) for t in tokens]
     tokens = [proc_tok + orig_tok.whitespace_ for proc_tok, orig_tok in zip(tokens, doc)]
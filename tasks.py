@@ -1,7 +1,10 @@
 from invoke import task
 
 @task
-def retrain_model(c, skip_preprocessing=False, sample_n=None, opt_trials=30):
+def retrain_model(c, skip_preprocessing=False, sample_n=None, opt_trials=30, embedding_cache=False,
+                  n_process=1, docs_cache=False, skip_vectorization=False, selection_cache=False,
+                  selection_sample_size=None, opt_jobs=4, optuna_storage=None,
+                  early_stopping_rounds=50, reduction=None, reduction_dim=128):
     """Retrain the model."""
 
     cmd = [
@@ -9,13 +12,76 @@ def retrain_model(c, skip_preprocessing=False, sample_n=None, opt_trials=30):
     ]
     if skip_preprocessing:
         cmd.append('--skip_preprocessing')
+    if skip_vectorization:
+        cmd.append('--skip_vectorization')
+    if embedding_cache:
+        cmd.append('--embedding_cache')
+    if docs_cache:
+        cmd.append('--docs_cache')
+    if selection_cache:
+        cmd.append('--selection_cache')
+    if selection_sample_size:
+        cmd.append(f'--selection_sample_size={selection_sample_size}')
     if sample_n:
         cmd.append(f'--sample_n={sample_n}')
     cmd.append(f'--optimization_trials={opt_trials}')
+    cmd.append(f'--optimization_jobs={opt_jobs}')
+    cmd.append(f'--early_stopping_rounds={early_stopping_rounds}')
+    if reduction:
+        cmd.append(f'--reduction={reduction} --reduction_dim={reduction_dim}')
+    if optuna_storage:
+        cmd.append(f'--optuna_storage={optuna_storage}')
+    cmd.append(f'--n_process={n_process}')
     command_str = ' '.join(cmd)
 
     c.run(command_str, pty=True)
 
+@task
+def build_spell_table(c, min_count=2):
+    """Precompute spelling corrections for the data set vocabulary."""
+    c.run(f'python -m src.scripts.build_spell_table --min_count={min_count}', pty=True)
+
+@task
+def build_symspell_snapshot(c):
+    """Prebuild the SymSpell index so spell checkers start without parsing the dictionary."""
+    c.run('python -m src.scripts.build_symspell_snapshot', pty=True)
+
+@task
+def benchmark_tokenizer(c, sample_n=5000, n_process='1,2,4,8', batch_size=1000):
+    """Measure spaCy preprocessing throughput for different process counts."""
+    n_process = ' '.join(n_process.split(','))
+    c.run(
+        f'python -m src.scripts.benchmark --sample_n={sample_n} '
+        f'--n_process {n_process} --batch_size={batch_size}',
+        pty=True
+    )
+
+@task
+def benchmark_vectorizer(c, sample_n=500, backends='torch,onnx,onnx-int8'):
+    """Compare SBERT throughput and per-message latency of the torch and ONNX backends."""
+    backends = ' '.join(backends.split(','))
+    c.run(
+        f'python -m src.scripts.benchmark --stage=vectorizer --sample_n={sample_n} --backends {backends}',
+        pty=True
+    )
+
+@task
+def benchmark_reduction(c, reduction='pca', dims='0,32,64,128,256'):
+    """Compare accuracy and classifier training/inference time at several embedding dimensions."""
+    dims = ' '.join(dims.split(','))
+    c.run(f'python -m src.scripts.benchmark --stage=reduction --reduction={reduction} --dims {dims}', pty=True)
+
+@task
+def benchmark_suite(c, stages='splitter,tokenizer,features,vectorizer,predict', corpus='synthetic',
+                    sample_n=1000, model='tiny', save_baseline=False, tolerance=0.2):
+    """Measure docs/sec and p50/p99 latency of every stage and compare them with the saved baseline."""
+    stages = ' '.join(stages.split(','))
+    c.run(
+        f'python -m src.scripts.benchmark_suite --stages {stages} --corpus={corpus} --sample_n={sample_n} '
+        f'--model={model} --tolerance={tolerance}' + (' --save_baseline' if save_baseline else ''),
+        pty=True
+    )
+
 @task
 def cli(c):
     c.run('python -m apps.cli.__main__')
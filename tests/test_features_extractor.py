@@ -1,6 +1,7 @@
 import pytest
 import spacy
 import numpy as np
+import pandas as pd
 from src.transformers.features_extractor import ExtraFeatures
 from src.transformers.spacy_tokenizer import SpacyTokenizer
 
@@ -12,13 +13,33 @@ nlp = spacy.load('en_core_web_sm', disable=["ner", "textcat"])
     [
         ('Image: http://www.test.com/img?id=5. Upvote it!', ('Image: [l]. Upvote it!', 1)),
         ('Profile: test.com/u/123. Profile: 127.0.0.1/u?id=1', ('Profile: [l]. Profile: [l]', 2)),
-        ("Don't do that", ("Don't do that", 0))
+        ("Don't do that", ("Don't do that", 0)),
+        ('Version 1.2.3, see www.test.co.uk:8080/news.', ('Version 1.2.3, see [l].', 1))
     ]
 )
-def test_replace_urls(text, expected):
-    result = extractor.replace_urls(text)
+@pytest.mark.parametrize('url_mode', ['fast', 'accurate'])
+def test_replace_urls(text, expected, url_mode):
+    result = ExtraFeatures(url_mode=url_mode).replace_urls(text)
     assert result == expected
 
+@pytest.mark.parametrize(
+    'text',
+    [
+        'Run it on http://localhost:8000/ first',
+        'See http://localhost:8000/api?q=1.',
+        'Wiki https://en.wikipedia.org/wiki/Foo_(bar) says',
+        '(see https://en.wikipedia.org/wiki/Foo_(bar))',
+        'Old link http://example.com/a). Dead',
+        'Try google.com! Now',
+        'Is it google.com? Yes, google.com, and (google.com).',
+        'Port google.com:80! and google.com;',
+        'Page google.com/a! Open file.txt'
+    ]
+)
+def test_replace_urls_fast_matches_accurate(text):
+    fast = ExtraFeatures(url_mode='fast').replace_urls(text)
+    assert fast == ExtraFeatures(url_mode='accurate').replace_urls(text)
+
 @pytest.mark.parametrize(
     'text,median_len,sentences_count',
     [
@@ -66,6 +87,31 @@ def test_base_stat(text, sentences, expected):
     for key in expected:
         assert result[key] == pytest.approx(expected[key], abs=0.01)
 
+def test_base_stat_batch():
+    texts = [
+        'Hello\n This is a typical neutral message.', "HI!!! I'M SOOOO EXCITED!!!! WHAT?????",
+        '', 'ÄÖ straße ΣΩ 𝐀𝐁 🙂 ǅ...', '\n\n!?'
+    ]
+    sentences = [2, 3, 0, 1, 5]
+    expected = np.array([
+        [extractor.base_stat(text, n)[name] for name in extractor.base_feature_names]
+        for text, n in zip(texts, sentences)
+    ])
+    result = extractor.base_stat_batch(texts, sentences)
+    np.testing.assert_array_equal(result, expected)
+
+def test_extract_matches_extract_row():
+    texts = ["Oh f*ck!!!!! It's really SURPR!SING. oO (o.o)", 'Image: http://www.test.com/img?id=5.', 'Ok']
+    docs = [nlp(t) for t in texts]
+    feats, _ = extractor.extract(docs)
+    expected = [
+        [extractor.extract_row(doc).get(name, 0) for name in extractor.numeric_feature_names]
+        for doc in docs
+    ]
+    # extract_row is the per-row path the extractor had before batching, features must stay bit-identical
+    assert feats.dtype == np.float64
+    np.testing.assert_array_equal(feats, np.array(expected))
+
 @pytest.mark.parametrize(
     'text,emotion,count',
     [
@@ -137,3 +183,16 @@ def test_transform(text, expected):
     np.testing.assert_array_equal(features, columns)
     for key in expected:
         assert result[key] == expected[key]
+
+def test_transform_stream():
+    texts = ["Oh f*ck!!!!! It's really surpr!sing. oO (o.o)", 'Image: http://www.test.com/img?id=5.', "Don't do that"]
+    expected = extractor.transform([nlp(t) for t in texts])
+    result = extractor.transform(nlp.pipe(texts, batch_size=2))
+    pd.testing.assert_frame_equal(result, expected)
+
+def test_transform_parallel():
+    texts = ["Oh f*ck!!!!! It's really surpr!sing. oO (o.o)", 'Image: http://www.test.com/img?id=5.', "Don't do that"]
+    docs = SpacyTokenizer().transform(texts * 5)
+    expected = extractor.transform(docs)
+    result = ExtraFeatures(n_jobs=2, shard_size=4).transform(docs)
+    pd.testing.assert_frame_equal(result, expected)
@@ -0,0 +1,64 @@
+import json
+import numpy as np
+import pytest
+from xgboost import XGBClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from src.pipelines import classification_pipeline, BoosterPredictor, ProfiledPipeline
+from src.util import profiler
+
+def test_booster_predictor():
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(300, 10))
+    y = (X[:, 0] + X[:, 1] > 0).astype(int)
+    pipeline = classification_pipeline({'n_estimators': 20, 'max_depth': 3, 'n_jobs': 1})
+    pipeline.fit(X, y)
+    predictor = BoosterPredictor.from_pipeline(pipeline)
+    np.testing.assert_allclose(predictor.predict_proba(X), pipeline.predict_proba(X), atol=1e-6)
+    np.testing.assert_array_equal(predictor.predict(X), pipeline.predict(X))
+    assert predictor.predict(X[0]).shape == (1,)
+    strict = BoosterPredictor.from_pipeline(pipeline, threshold=1.0)
+    assert strict.predict(X).sum() == 0
+
+def test_booster_predictor_keeps_pipeline_booster():
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(100, 5))
+    y = (X[:, 0] > 0).astype(int)
+    pipeline = classification_pipeline({'n_estimators': 5, 'max_depth': 2, 'n_jobs': 3})
+    pipeline.fit(X, y)
+    booster = pipeline[-1].get_booster()
+    config = booster.save_config()
+    predictor = BoosterPredictor.from_pipeline(pipeline, n_threads=1)
+    assert booster.save_config() == config
+    assert json.loads(predictor.booster.save_config())['learner']['generic_param']['nthread'] == '1'
+
+def test_booster_predictor_binary_only():
+    X = np.arange(30, dtype=float).reshape(-1, 1)
+    y = np.arange(30) % 3
+    classifier = XGBClassifier(n_estimators=2).fit(X, y)
+    with pytest.raises(ValueError):
+        BoosterPredictor.from_pipeline(classifier)
+
+def test_profiled_pipeline():
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(50, 3))
+    pipeline = Pipeline([('scale', StandardScaler())]).fit(X)
+    profiled = ProfiledPipeline.from_pipeline(pipeline, 'test')
+    profiler.reset()
+    profiler.enable()
+    try:
+        np.testing.assert_allclose(profiled.transform(X), pipeline.transform(X))
+    finally:
+        profiler.disable()
+    assert profiler.to_dict()['test.scale']['rows'] == 50
+
+def test_classifier_predictions_with_float32_input():
+    # The vectorization pipeline now outputs float32. XGBoost casts input to float32 itself,
+    # so classifiers trained on float64 features predict exactly the same
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(300, 10))
+    y = (X[:, 0] + X[:, 1] > 0).astype(int)
+    pipeline = classification_pipeline({'n_estimators': 20, 'max_depth': 3, 'n_jobs': 1}).fit(X, y)
+    X32 = X.astype(np.float32)
+    np.testing.assert_array_equal(pipeline.predict_proba(X32), pipeline.predict_proba(X))
+    np.testing.assert_array_equal(BoosterPredictor.from_pipeline(pipeline).predict_proba(X), pipeline.predict_proba(X))
@@ -0,0 +1,23 @@
+from src.scripts.benchmark_suite import synthetic_corpus, compare
+
+def test_synthetic_corpus():
+    texts, labels = synthetic_corpus(50)
+    assert (texts, labels) == synthetic_corpus(50)
+    assert len(texts) == len(labels) == 50
+    assert set(labels) == {'suicide', 'non-suicide'}
+    lengths = [len(text.split()) for text in texts]
+    assert min(lengths) < 20 < max(lengths)
+
+def test_benchmark_compare():
+    baseline = {
+        'tokenizer': {'docs_per_sec': 100.0, 'p99_ms': 10.0},
+        'predict': {'docs_per_sec': 10.0, 'p99_ms': 100.0}
+    }
+    results = {
+        'tokenizer': {'docs_per_sec': 95.0, 'p99_ms': 11.0},
+        'predict': {'docs_per_sec': 10.0, 'p99_ms': 150.0},
+        'splitter': {'docs_per_sec': 1.0, 'p99_ms': 1.0}
+    }
+    regressions = compare(results, baseline, tolerance=0.2)
+    assert list(regressions) == ['predict']
+    assert regressions['predict']['p99_ratio'] == 1.5
@@ -1,4 +1,5 @@
 import math
+from unittest.mock import patch
 from sklearn.preprocessing import FunctionTransformer
 import pytest
 import numpy as np
@@ -6,8 +7,10 @@ import pandas as pd
 from src.transformers import (
     fix_concatenated_words,
     SpacyTokenizer, FeatureSelector,
-    SbertVectorizer
+    SbertVectorizer, EmbeddingReducer
 )
+from src.transformers.sentece_splitter import _fix_concatenated_text_by_replace
+from src.transformers.feature_selector import random_forest_importance, methods
 
 @pytest.mark.parametrize(
     'text,expected',
@@ -23,6 +26,16 @@ def test_sentence_splitter(text, expected):
     transformed = splitter.transform([text])[0]
     assert transformed == expected
 
+def test_sentence_splitter_matches_replace_algorithm():
+    texts = [
+        'HELP!HELP! I need some help!', 'TEST//TEST//TEST', 'BEEP||||BEEP|||BEEP||BEEP', "Don't do that",
+        'wow...really?!ok', 'see https://a.com/b?c=d.ok, https://a.com/b?c=d', 'f*ck:)world?! c  ?!https://a.com/x',
+        'Ib(o.o)worldworld!-...hehttps://a.com/b?c=d  (o.o)worlda', 'x.yllo x.yllo.abc', ''
+    ]
+    expected = [_fix_concatenated_text_by_replace(text) for text in texts]
+    assert fix_concatenated_words(texts) == expected
+    assert fix_concatenated_words(texts * 100, n_jobs=2) == expected * 100
+
 @pytest.mark.parametrize(
     'text,expected',
     [
@@ -40,6 +53,40 @@ def test_spacy_tokenizer(text, expected):
     count = len(sentences_len)
     assert count == expected
 
+def test_spacy_tokenizer_lazy():
+    texts = ['HI!!! My name is Jonas!! What is your name?????', "Don't do that/"]
+    tokenizer = SpacyTokenizer(batch_size=1, materialize=False)
+    docs = tokenizer.transform(texts)
+    assert not isinstance(docs, list)
+    assert [doc.text for doc in docs] == texts
+
+def test_spacy_tokenizer_docs_cache(tmp_path):
+    texts = ['HI!!! My name is Jonas!! What is your name?????', "Don't do that/"] * 3
+    tokenizer = SpacyTokenizer(cache_dir=tmp_path, cache_shard_size=4)
+    parsed = tokenizer.transform(texts)
+    assert len(list(tmp_path.glob('*.spacy'))) == 2
+    loaded = tokenizer.transform(texts)
+    assert [doc.text for doc in loaded] == texts
+    for parsed_doc, loaded_doc in zip(parsed, loaded):
+        assert [s.text for s in parsed_doc.sents] == [s.text for s in loaded_doc.sents]
+        assert [t.lemma_ for t in parsed_doc] == [t.lemma_ for t in loaded_doc]
+
+def test_spacy_tokenizer_fingerprint():
+    tokenizer = SpacyTokenizer()
+    rules = dict(tokenizer.nlp.tokenizer.rules)
+    fingerprint = tokenizer._pipeline_fingerprint()
+    assert tokenizer._pipeline_fingerprint() == fingerprint
+    key = next(iter(rules))
+    try:
+        # Same amount of special cases, different content
+        changed = {k: v for k, v in rules.items() if k != key}
+        changed['qwertyuiop'] = [{'ORTH': 'qwerty'}, {'ORTH': 'uiop'}]
+        tokenizer.nlp.tokenizer.rules = changed
+        assert len(tokenizer.nlp.tokenizer.rules) == len(rules)
+        assert tokenizer._pipeline_fingerprint() != fingerprint
+    finally:
+        tokenizer.nlp.tokenizer.rules = rules
+
 def test_feature_selector():
     np.random.seed(42)
     sample_size = 50
@@ -54,6 +101,39 @@ def test_feature_selector():
     result = selector.fit_transform(X, y)
     np.testing.assert_array_equal(np.sort(list(result.columns)), ['a', 'b'])
 
+def test_feature_selector_cache(tmp_path):
+    rng = np.random.default_rng(42)
+    y = rng.integers(0, 2, size=200)
+    X = pd.DataFrame({
+        'a': y + rng.normal(scale=0.5, size=200),
+        'b': -y + rng.normal(scale=0.5, size=200),
+        'c': rng.normal(size=200)
+    })
+    selector = FeatureSelector(top_k=2, cache_dir=tmp_path, sample_size=100)
+    expected = selector.fit(X, y).get_feature_names_out()
+    assert len(list(tmp_path.glob('*.json'))) == 1
+    with patch('src.transformers.feature_selector.comprehensive_feature_analysis') as analysis:
+        result = FeatureSelector(top_k=2, cache_dir=tmp_path, sample_size=100).fit(X, y)
+        analysis.assert_not_called()
+    assert sorted(result.get_feature_names_out()) == sorted(expected) == ['a', 'b']
+    y_labels = np.where(y == 1, 'suicide', 'non-suicide').astype(object)
+    path = selector._cache_path(X, y_labels)
+    assert path == selector._cache_path(X, y_labels.copy())
+    forest_defaults = random_forest_importance.__defaults__
+    with patch.object(random_forest_importance, '__defaults__', (50, *forest_defaults[1:])):
+        assert selector._cache_path(X, y_labels) != path
+
+def test_feature_selector_cache_skips_failed_methods(tmp_path):
+    rng = np.random.default_rng(42)
+    y = rng.integers(0, 2, size=100)
+    X = pd.DataFrame({'a': y + rng.normal(scale=0.5, size=100), 'b': rng.normal(size=100)})
+    def broken_method(X, y, feature_names):
+        raise ValueError('broken')
+    with patch.dict(methods, {'broken': broken_method}):
+        result = FeatureSelector(top_k=1, cache_dir=tmp_path).fit(X, y)
+    assert list(result.get_feature_names_out()) == ['a']
+    assert not list(tmp_path.glob('*.json'))
+
 vectorizer = SbertVectorizer('sentence-transformers/all-mpnet-base-v2')
 
 @pytest.mark.parametrize(
@@ -73,7 +153,63 @@ def test_sbert_vectorizer_chunk_text_by_tokens(text, chunks):
     assert token_len > 0
     assert len(result) == chunks
 
+def test_sbert_vectorizer_chunks_fit_model_input():
+    text = 'Some words, and some more words without sentence end\n' * 300
+    result = vectorizer._chunk_text_by_tokens(text)
+    assert len(result) > 1
+    assert all(vectorizer._token_length(c) <= vectorizer.chunk_token_size for c in result)
+    assert result[0].startswith('Some words')
+
+def test_sbert_vectorizer_unpickle_old_state():
+    # State of a vectorizer pickled before the batching, cache and backend options
+    state = {
+        'model_name': vectorizer.model_name,
+        'model': vectorizer.model,
+        'tokenizer': vectorizer.tokenizer,
+        'chunk_token_size': vectorizer.chunk_token_size,
+        'overlap': vectorizer.overlap
+    }
+    restored = SbertVectorizer.__new__(SbertVectorizer)
+    restored.__setstate__(state)
+    text = 'Some words, and some more words without sentence end\n' * 300
+    assert restored._chunk_text_by_tokens(text) == vectorizer._chunk_text_by_tokens(text)
+    assert restored.vectorization_settings() == vectorizer.vectorization_settings()
+
 def test_sbert_vecorizer_transform():
     text = 'Small text to test vectorizer'
     result = vectorizer.transform([text])[0]
     assert len(result) == 768
+
+def test_sbert_vectorizer_cross_document():
+    texts = ['Small text to test vectorizer', 'Very loooong text. '*150, 'STOP!!! '*10]
+    batched = vectorizer.transform(texts)
+    vectorizer.set_params(cross_document=False)
+    try:
+        per_document = vectorizer.transform(texts)
+    finally:
+        vectorizer.set_params(cross_document=True)
+    assert batched.shape == (3, 768)
+    np.testing.assert_allclose(batched, per_document, atol=1e-5)
+
+@pytest.mark.parametrize('quantize,min_similarity', [(False, 0.999), (True, 0.95)])
+def test_sbert_vectorizer_onnx_parity(tmp_path, quantize, min_similarity):
+    pytest.importorskip('optimum.onnxruntime')
+    texts = ['Small text to test vectorizer', 'Very loooong text. '*150, 'STOP!!! '*10]
+    onnx_vectorizer = SbertVectorizer(backend='onnx', quantize=quantize, onnx_dir=tmp_path)
+    expected = vectorizer.transform(texts)
+    result = onnx_vectorizer.transform(texts)
+    similarity = (expected * result).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(result, axis=1)
+    )
+    assert result.shape == expected.shape
+    assert similarity.min() > min_similarity
+
+@pytest.mark.parametrize('method', EmbeddingReducer.methods)
+def test_embedding_reducer(method):
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(100, 64))
+    reducer = EmbeddingReducer(method, n_components=16).fit(X)
+    reduced = reducer.transform(X[:10])
+    assert reduced.shape == (10, 16)
+    assert reduced.dtype == np.float32
+    assert EmbeddingReducer(method, n_components=500).fit_transform(X).shape[1] <= 64
@@ -1,8 +1,15 @@
+import threading
 from unittest.mock import patch
 import pytest
 import spacy
 import numpy as np
-from src.util import CachingSpellChecker, typos_processor, PathHelper
+import pandas as pd
+from symspellpy import Verbosity
+from emot import emot
+from src.util import (
+    CachingSpellChecker, CorrectionTable, SymSpellSnapshot, EmoticonMatcher, typos_processor, PathHelper, EmbeddingCache,
+    save_features, load_features, save_vectorized, load_vectorized, MicroBatcher, StageProfiler
+)
 
 nlp = spacy.load('en_core_web_sm', disable=["ner", "textcat"])
 
@@ -29,6 +36,36 @@ def test_correct_word(words, calls):
         spell_checker.correct_words(words)
         assert mock_method.call_count == calls
 
+def test_correct_words_with_table(tmp_path):
+    CorrectionTable.save({'heck': 'check', 'beep': 'beep'}, tmp_path)
+    with patch.object(CachingSpellChecker, '_correct_word', return_value=('bump', 'dump')) as mock_method:
+        spell_checker = CachingSpellChecker(correction_table=tmp_path)
+        corrected = spell_checker.correct_words(['heck', 'beep', 'bump', 'heck'])
+        assert corrected == ['check', 'beep', 'dump', 'check']
+        assert mock_method.call_count == 1
+
+def test_symspell_snapshot(tmp_path):
+    symspell = CachingSpellChecker.load_symspell_dictionary()
+    SymSpellSnapshot.save(symspell, tmp_path)
+    loaded = SymSpellSnapshot.load(tmp_path)
+    assert SymSpellSnapshot.load(tmp_path / 'missing') is None
+    for word in ['helo', 'fimd', 'miself', 'recieve', 'a', '', 'qzxqzxqzx']:
+        expected = [(s.term, s.distance, s.count) for s in symspell.lookup(word, Verbosity.CLOSEST, 2)]
+        actual = [(s.term, s.distance, s.count) for s in loaded.lookup(word, Verbosity.CLOSEST, 2)]
+        assert actual == expected
+
+@pytest.mark.parametrize(
+    'text',
+    ["Hey, how you're doing ;)", "It's so stuped lol :-))) (o.o)", 'Love you :* :* :*', 'No emoticons']
+)
+def test_emoticon_matcher(text):
+    matcher = EmoticonMatcher()
+    detected = emot().emoticons(text)
+    assert matcher.find(text) == detected['value']
+    assert sorted(matcher.count_meanings(text).elements()) == sorted(detected['mean'])
+    for token in nlp(text):
+        assert matcher.flag(token.text) == emot().emoticons(token.text)['flag']
+
 @pytest.mark.parametrize(
     'text,expected',
     [
@@ -45,3 +82,170 @@ def test_path_helper():
     assert 'nlp_suicide_watch' in str(PathHelper.project_root.resolve())
     assert 'models/' in str(PathHelper.models.label_encoder.resolve())
     assert 'data/processed/' in str(PathHelper.data.processed.x_train.resolve())
+
+def test_embedding_cache(tmp_path):
+    cache = EmbeddingCache(tmp_path, 'test-model', dim=4, max_size_mb=3 * 4 * 4 / 2**20)
+    assert cache.capacity == 3
+    cache.put(['a', 'b', 'c'], np.eye(3, 4))
+    cache.lookup(['b', 'c'])
+    # 'a' is the least recently used row and gets evicted
+    cache.put(['d'], np.ones((1, 4)))
+    cache.flush()
+    # Only one writer per directory, the second cache opened meanwhile is read-only
+    reader = EmbeddingCache(tmp_path, 'test-model', dim=4, max_size_mb=3 * 4 * 4 / 2**20)
+    assert reader.read_only and not reader.available
+    reader.close()
+    cache.close()
+
+    reloaded = EmbeddingCache(tmp_path, 'test-model', dim=4, max_size_mb=3 * 4 * 4 / 2**20)
+    embeddings, found = reloaded.lookup(['a', 'b', 'd'])
+    np.testing.assert_array_equal(found, [False, True, True])
+    np.testing.assert_array_equal(embeddings[1], [0, 1, 0, 0])
+    np.testing.assert_array_equal(embeddings[2], [1, 1, 1, 1])
+    assert reloaded.stats()['hits'] == 2
+    assert reloaded.stats()['misses'] == 1
+    reloaded.close()
+
+def test_embedding_cache_readers(tmp_path):
+    writer = EmbeddingCache(tmp_path, 'test-model', dim=4)
+    writer.put(['a'], np.ones((1, 4)))
+    writer.flush()
+    writer.close()
+    readers = [EmbeddingCache(tmp_path, 'test-model', dim=4, read_only=True) for _ in range(2)]
+    readers[0].put(['b'], np.ones((1, 4)))
+    _, found = readers[1].lookup(['a', 'b'])
+    np.testing.assert_array_equal(found, [True, False])
+    # Readers keep writers out until they are closed
+    assert EmbeddingCache(tmp_path, 'test-model', dim=4).read_only
+    for reader in readers:
+        reader.close()
+
+def test_embedding_cache_read_only_memory(tmp_path, caplog):
+    writer = EmbeddingCache(tmp_path, 'test-model', dim=4)
+    # A second writer is downgraded to read-only and keeps new embeddings in memory
+    cache = EmbeddingCache(tmp_path, 'test-model', dim=4, memory_size_mb=2 * 4 * 4 / 2**20)
+    assert cache.read_only and 'opening it read-only' in caplog.text
+    cache.put(['a', 'b'], np.eye(2, 4))
+    cache.lookup(['a'])
+    # 'b' is the least recently used entry and gets evicted
+    cache.put(['c'], np.ones((1, 4)))
+    embeddings, found = cache.lookup(['a', 'b', 'c'])
+    np.testing.assert_array_equal(found, [True, False, True])
+    np.testing.assert_array_equal(embeddings[0], [1, 0, 0, 0])
+    assert cache.stats()['memory_size'] == 2
+    assert len(cache) == 0
+    cache.close()
+    writer.close()
+
+def test_embedding_cache_concurrent_put(tmp_path):
+    cache = EmbeddingCache(tmp_path, 'test-model', dim=4)
+    texts = [f'text {i}' for i in range(50)]
+    threads = [
+        threading.Thread(target=cache.put, args=(texts, np.ones((50, 4))))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(cache) == 50
+    cache.close()
+
+def test_feature_store(tmp_path):
+    df = pd.DataFrame({'text': ['first', 'second'], 'length': [5.0, 6.0], 'sentences_count': [1, 2]})
+    path = tmp_path / 'features.parquet'
+    save_features(df, path)
+    pd.testing.assert_frame_equal(load_features(path), df)
+    assert list(load_features(path, columns=['length']).columns) == ['length']
+
+def test_vectorized_store(tmp_path):
+    X = np.random.rand(4, 3)
+    path = tmp_path / 'X_vectorized.npy'
+    manifest = {'model_name': 'test', 'input_hash': 'abc'}
+    save_vectorized(X, path, manifest)
+    loaded = load_vectorized(path, manifest)
+    assert loaded.dtype == np.float32
+    np.testing.assert_allclose(loaded, X, rtol=1e-6)
+    assert load_vectorized(path, {**manifest, 'input_hash': 'other'}) is None
+
+def test_micro_batcher():
+    batch_sizes = []
+    def predict(batch):
+        batch_sizes.append(len(batch))
+        return [x * 2 for x in batch]
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=50)
+    results = {}
+    def request(i):
+        results[i] = batcher.predict_sync(i, timeout=5)
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+    assert results == {i: i * 2 for i in range(10)}
+    assert sum(batch_sizes) == 10
+    assert max(batch_sizes) <= 4
+    assert len(batch_sizes) < 10
+
+def test_stage_profiler():
+    profiler = StageProfiler()
+    with profiler.stage('disabled', 10):
+        pass
+    assert profiler.to_dict() == {}
+    profiler.enable()
+    with profiler.stage('tokenize', 10):
+        pass
+    profiler.record('tokenize', 0.2, 5)
+    with profiler.stage('allocate'):
+        # Touched pages are resident until the array is freed
+        data = np.ones(32 * 2**20 // 8)
+    del data
+    stage = profiler.to_dict()['tokenize']
+    assert stage['count'] == 2
+    assert stage['rows'] == 15
+    assert sum(stage['buckets']) == 2
+    assert profiler.to_dict()['allocate']['max_rss_growth_bytes'] >= 16 * 2**20
+    metrics = profiler.to_prometheus()
+    assert 'stage_latency_seconds_bucket{stage="tokenize",le="+Inf"} 2' in metrics
+    assert 'stage_latency_seconds_bucket{stage="tokenize",le="0.25"} 2' in metrics
+    assert 'stage_rows_total{stage="tokenize"} 15' in metrics
+    assert 'stage_max_rss_growth_bytes{stage="allocate"}' in metrics
+
+def test_micro_batcher_result_count_mismatch():
+    batcher = MicroBatcher(lambda batch: batch[:-1], max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    batcher.close()
+
+def test_micro_batcher_bad_input():
+    def predict(batch):
+        if None in batch:
+            raise TypeError('bad input')
+        return [x * 2 for x in batch]
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=50)
+    futures = [batcher.submit(x) for x in (1, None, 3)]
+    assert futures[0].result(timeout=5) == 2
+    with pytest.raises(TypeError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 6
+    batcher.close()
+
+def test_micro_batcher_close_fails_pending():
+    started, release = threading.Event(), threading.Event()
+    def predict(batch):
+        started.set()
+        release.wait(5)
+        return batch
+    batcher = MicroBatcher(predict, max_batch_size=1, max_wait_ms=0)
+    futures = [batcher.submit(i) for i in range(3)]
+    started.wait(5)
+    threading.Timer(0.2, release.set).start()
+    batcher.close()
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+    with pytest.raises(RuntimeError):
+        batcher.submit(4)